@@ -1,215 +1,2480 @@
 import serial
-import io
+import os
 import time
 import requests
 import cv2
+import numpy as np
 import threading
+import collections
+import queue
+import sqlite3
+import datetime
+import uuid
+import itertools
+import heapq
+import contextlib
+import multiprocessing
+import struct
+import binascii
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from serial.serialutil import SerialException
 from google.cloud import storage
 
+# 시리얼 포트 재연결 감지용 pyudev 가 없으면 경로 폴링
+try:
+    import pyudev
+    PYUDEV_AVAILABLE = True
+except ImportError:
+    PYUDEV_AVAILABLE = False
+
+# CPU 로컬 추론용 onnxruntime 이 없으면 OpenCV dnn 사용
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# libjpeg-turbo 기반 simplejpeg 가 설치돼 있으면 사용
+try:
+    import simplejpeg
+    SIMPLEJPEG_AVAILABLE = True
+except ImportError:
+    SIMPLEJPEG_AVAILABLE = False
+
 # ─────────────────────────────
 # 기본 설정
-PORT = '/dev/ttyACM0'               # Arduino와 연결된 시리얼 포트
-BAUD = 9600                         # 시리얼 통신 속도
+PORT = '/dev/ttyACM0'               # Arduino와 연결된 시리얼 포트 (재연결 시 번호가 바뀌면 /dev/serial/by-id/... 사용)
+BAUD = 9600                         # 시리얼 통신 속도 (기존 텍스트 펌웨어)
+SERIAL_PROTOCOL = "text"            # text: 줄 단위 문자열 (기존 펌웨어), framed: 길이/순번/체크섬/타임스탬프 프레임
+FRAMED_BAUD = 115200                # framed 프로토콜 통신 속도
+SERIAL_TIMEOUT = 0.2                # 시리얼 읽기 대기 (초)
+SERIAL_RESET_ON_OPEN = False        # False 면 DTR 을 내린 채 열어 아두이노 리셋/부팅 대기를 생략
+SERIAL_BOOT_WAIT = 1.5              # 아두이노가 (재)부팅 중일 수 있을 때 첫 수신을 기다리는 최대 시간 (초)
+SERIAL_RECONNECT_POLL = 0.05        # 포트 재등장 확인 주기 (초, pyudev 가 있으면 이벤트로 즉시 깨어남)
+SERIAL_REPLAY_MAX_AGE = 5.0         # 재연결 후 다시 보낼 응답의 최대 나이 (초), 오래된 응답은 버림
+SERIAL_ACK = "ACK"                  # framed 펌웨어의 응답 수신 확인 ("ACK:<순번>")
 
 SNAP1_KEYWORD = "SNAP1"             # 결함 검사 트리거 신호
 SNAP2_KEYWORD = "SNAP2"             # 등급 검사 트리거 신호
 
+LINES = None                        # 컨베이어 라인 설정 목록 (None 이면 이 파일의 설정으로 한 라인), 형식은 default_lines() 참고
+LINE_PROCESSES = False              # True: 라인마다 별도 프로세스로 실행 (GIL 분리, 메트릭 포트는 라인 순서만큼 +1)
+LINE_RESTART_DELAY = 2.0            # 라인이 예외로 멈추면 다시 시작하기까지 대기 (초)
+DEFAULT_LINE = "main"               # LINES 를 쓰지 않을 때의 라인 이름 (헬스/메트릭 키에 접두어를 붙이지 않음)
+
 URL_SNAP1 = 'http://34.64.178.127:8000/defect'     # 결함 판단 AI 서버
 URL_SNAP2 = 'http://34.64.178.127:8100/classify'   # 등급 판단 Rule 서버
+HEALTH_URL_SNAP1 = 'http://34.64.178.127:8000/health'   # 결함 판단 서버 헬스체크
+HEALTH_URL_SNAP2 = 'http://34.64.178.127:8100/health'   # 등급 판단 서버 헬스체크
+INFER_POOL_SIZE = 4                                # 서버별 유지할 keep-alive 연결 수
+INFER_WORKERS = 8                                  # 라인별 추론 요청 스레드 수 (재시도/헤지 요청 포함)
+INFER_REPLICAS = {URL_SNAP1: [], URL_SNAP2: []}    # 헤지 요청을 보낼 보조 서버 주소 (없으면 헤지 안 함)
+SNAP1_BUDGET = 0.8                                 # 결함 판정 지연 예산 (초), 초과 시 GO
+SNAP2_BUDGET = 1.5                                 # 등급 판정 지연 예산 (초), 초과 시 GO
+HEDGE_DELAY = 0.3                                  # 응답이 없을 때 보조 서버로 추가 요청하기까지 대기 (초)
+INFER_RETRY_DELAY = 0.1                            # 서버 오류 후 재시도까지 대기 (초)
+BREAKER_FAILURES = 3                               # 연속 실패(트리거 단위, 요청 1건당 서버별 최대 1회) 시 서버 호출 차단
+BREAKER_COOLDOWN = 10                              # 차단 후 시험 요청까지 대기 (초)
+
+PIPELINE_MODE = False                              # True: 촬영 직후 벨트를 다시 움직이고 판정은 부품이 분류기에 도착할 때 전송
+PIPELINE_DEPTH = 4                                 # 스테이션별로 동시에 처리 중일 수 있는 부품 수
+PIPELINE_RELEASE = b"CAPTURED\n"                   # 촬영 완료 응답 (펌웨어는 이 응답에 벨트를 재개)
+PIPELINE_TRAVEL = {"SNAP1": 1.5, "SNAP2": 1.5}     # 트리거부터 분류 명령을 보내야 하는 시점까지 (초, 벨트 속도로 보정)
+PIPELINE_SORT = {                                  # 판정별 분류 명령 (없음 = 통과, "*" = 그 외 판정, "fallback" = 판정 없음, 기본 통과)
+    "SNAP1": {"X": "SERVO 150"},
+    "SNAP2": {"A": "SERVO 30", "*": "SERVO 90"},
+}
+
+LOCAL_MODEL_PATH = None                            # 결함 판정 로컬 ONNX 모델 경로 (None 이면 사용 안 함)
+LOCAL_MODEL_MODE = "fallback"                      # fallback: 서버가 예산 초과 시 사용, first_pass: 확실하면 서버 생략
+LOCAL_MODEL_INPUT = (224, 224)                     # 모델 입력 크기 (W, H)
+LOCAL_MODEL_LABELS = ("O", "X")                    # 모델 출력 순서별 라벨 (정상, 불량)
+LOCAL_MODEL_CONFIDENT = 0.9                        # first_pass 에서 서버 없이 확정할 최소 확률
+LOCAL_MODEL_TIMEOUT = 0.3                          # 서버 실패 후 로컬 결과를 기다리는 최대 시간 (초)
+LOCAL_MODEL_WORKERS = 1                            # 로컬 추론 스레드 수
 
 GCS_KEY_PATH = "service-account.json"              # GCP 인증 키
 BUCKET_NAME = "zezeone_images"                     # 저장할 GCS 버킷명
 GCS_FOLDER_SNAP1 = "raw_defect"                    # 결함 검사 이미지 저장 경로
 GCS_FOLDER_SNAP2 = "raw_grade"                     # 등급 검사 이미지 저장 경로
+UPLOAD_WORKERS = 2                                 # 백그라운드 업로드 스레드 수
+UPLOAD_QUEUE_SIZE = 32                             # 업로드 대기열 최대 길이
+UPLOAD_PUT_TIMEOUT = 0.05                          # 대기열이 가득 찼을 때 기다리는 시간 (초)
+
+GCS_TOKEN_REFRESH_MARGIN = 300                     # 토큰 만료 몇 초 전에 미리 갱신할지
+GCS_STATS_WINDOW = 60                              # 업로드 속도 계산 구간 (초)
+GCS_UPLOAD_TIMEOUT = 10                            # 업로드 1건 제한 시간 (초), 라이브러리 자체 재시도는 끄고 재시도는 spool 이 담당
+
+SPOOL_DIR = "spool"                                # 업로드 실패 이미지 보관 폴더
+SPOOL_MAX_BYTES = 1024 * 1024 * 1024               # 보관 용량 상한 (초과 시 오래된 것부터 삭제)
+SPOOL_DRAIN_WORKERS = 4                            # 재전송 병렬 스레드 수
+SPOOL_RETRY_DELAY = (2, 60)                        # 재전송 실패 시 대기 시간 (최소, 최대 초)
 
 CAM_IR1 = 0                         # 일반 카메라 인덱스 (결함 검사용)
 CAM_IR2 = 2                         # 현미경 카메라 인덱스 (등급 검사용)
 RESOLUTION = (1280, 720)           # 카메라 캡처 해상도
+CAM_BUFFER_SIZE = 8                # 카메라별 최근 프레임 링버퍼 크기 (30fps 기준 약 0.27초, 트리거 시각 프레임 선택용)
+CAM_TRIGGER_ALIGN = True           # 트리거 도착 시각에 가장 가까운 링버퍼 프레임 사용 (False 면 트리거 이후 새 프레임)
+CAM_TRIGGER_OFFSET = {CAM_IR1: 0.0, CAM_IR2: 0.0}   # 카메라별 센서 감지→트리거 도착 지연 보정 (초), 목표 시각 = 도착 - 보정값
+CAM_ALIGN_MAX_SKEW = 1.5           # 트리거 시각과 선택 프레임의 최대 차이 (프레임 간격 배수), 넘으면 새 프레임 촬영
+CAM_TIMESTAMP_MAX_SKEW = 0.5       # 드라이버(V4L2) 프레임 타임스탬프가 수신 시각과 이보다 차이 나면 수신 시각 사용 (초)
+CAM_READ_TIMEOUT = 1.0             # 새 프레임 대기 최대 시간 (초)
+CAM_REOPEN_DELAY = 0.5             # 카메라 끊김 시 재연결 간격 (초)
+CAM_MJPEG_PASSTHROUGH = True       # 카메라의 MJPG 압축 데이터를 디코딩/재인코딩 없이 그대로 사용
+JPEG_BACKEND = "auto"              # JPEG 인코더: auto(simplejpeg 우선) | simplejpeg | opencv
+JPEG_PROFILES = {                  # 용도별 인코딩 설정 (quality, 크로마 서브샘플링, progressive)
+    "archive": {"quality": 95, "subsampling": "444", "progressive": False},   # GCS 보관용 원본
+    "snap1":   {"quality": 85, "subsampling": "420", "progressive": False},   # 결함 검사 추론용
+    "snap2":   {"quality": 90, "subsampling": "444", "progressive": False},   # 현미경 등급 추론용 (색 정보 유지)
+}
+ENCODE_WORKERS = 2                 # JPEG 인코딩 스레드 수
+PREPROCESS = {                     # 추론 서버로 보낼 이미지: 가운데 crop (W, H) 후 size (W, H) 로 축소, None 이면 생략
+    "snap1": {"crop": (720, 720), "size": (384, 384)},
+    "snap2": {"crop": (720, 720), "size": None},
+}
+BURST_SNAP2 = 4                    # SNAP2 연속 촬영 장수 (가장 선명한 프레임 사용, 1 이면 단일 촬영)
+SETTLE_MAX = 2.0                   # 카메라 (재)연결 후 노출 안정화 최대 대기 (초)
+SETTLE_TOLERANCE = (0.02, 0.10)    # 연속 프레임 간 허용 변화율 (밝기, 선명도)
+SETTLE_STABLE_FRAMES = 3           # 이만큼 연속으로 변화가 작으면 안정화 완료
+QUALITY_GATE = {                   # 네트워크 전송 전 프레임 품질 기준 (None 이면 검사 안 함)
+    "min_brightness": 15,          # 평균 밝기 하한 (0~255), 너무 어두우면 불합격
+    "max_brightness": 240,         # 평균 밝기 상한, 과노출이면 불합격
+    "min_contrast": 6.0,           # 밝기 표준편차 하한
+    "max_clipped": 0.5,            # 완전 검정/흰색 픽셀 비율 상한
+    "min_focus": 5.0,              # 초점 점수 하한 (모션 블러)
+    "min_diff": 0.01,              # 직전 부품 프레임과의 평균 차이 하한 (사실상 동일 = 멈춘/오래된 프레임)
+}
+QUALITY_RETRIES = 2                # 불합격 시 다시 촬영하는 횟수
+CAM_STALE_AFTER = 2.0              # 마지막 프레임 이후 이 시간이 지나면 카메라 이상으로 판단 (초)
+VERDICT_CACHE_SIZE = 64            # 스테이션별로 기억하는 최근 판정 수 (0 이면 캐시 사용 안 함)
+VERDICT_CACHE_WINDOW = 0.3         # 같은 부품의 재트리거로 볼 직전 트리거와의 최대 간격 (초, 사이에 벨트 재개가 없어야 함)
+VERDICT_CACHE_TTL = 5.0            # 같은 순번(seq) 트리거 재전송에 판정을 재사용할 유효 시간 (초)
+VERDICT_CACHE_DISTANCE = 4         # 같은 부품으로 볼 최대 해밍 거리 (64비트 dHash 기준)
 
 FRONT_HEALTHCHECK_URL = 'http://<frontend-ip>/api/healthcheck'  # 프론트엔드 헬스체크 수신 URL
+HEALTH_INTERVAL = 60                # 헬스체크 주기 (초)
+HEALTH_TIMEOUT = 1.5                # 서버/프론트엔드 헬스체크 요청 타임아웃 (초)
+
+METRICS_ADDR = ("0.0.0.0", 9105)    # Prometheus 메트릭 엔드포인트 (/metrics), None 이면 사용 안 함
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)   # 히스토그램 구간 (초)
+
+# ─────────────────────────────
+# 지연 시간 측정 (트리거별 구간 기록 + 히스토그램 + Prometheus 엔드포인트)
+
+# 백분위수 계산 (정렬된 값 목록 기준)
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+# 누적 구간 카운트(Prometheus 용) + 최근 표본(백분위 계산용)
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = collections.deque(maxlen=1000)
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self):
+        values = sorted(self.recent)
+        result = {"count": self.count}
+        for q in (50, 95, 99):
+            v = percentile(values, q)
+            result[f"p{q}_ms"] = round(v * 1000, 1) if v is not None else None
+        return result
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}    # (name, labels) → Histogram
+        self.counters = collections.Counter()   # (name, labels) → 값
+        self.finished = collections.defaultdict(collections.deque)   # station → 최근 완료 시각
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    # 스테이션별 분당 처리량 계산용 완료 시각 기록
+    def mark_done(self, station):
+        now = time.monotonic()
+        with self.lock:
+            done = self.finished[station]
+            done.append(now)
+            while done and now - done[0] > 60:
+                done.popleft()
+
+    # 헬스 상태에 넣을 요약: {이름: {라벨: {count, p50_ms, p95_ms, p99_ms}}}
+    def summary(self):
+        now = time.monotonic()
+        with self.lock:
+            latency = collections.defaultdict(dict)
+            for (name, labels), hist in self.histograms.items():
+                label = ",".join(v for _, v in labels) or "all"
+                latency[name][label] = hist.summary()
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                label = ",".join(v for _, v in labels)
+                counters[f"{name}{{{label}}}" if label else name] = value
+            per_min = {station: sum(1 for t in done if now - t <= 60) for station, done in self.finished.items()}
+        return {"latency": dict(latency), "counters": counters, "parts_per_min": per_min}
+
+    # Prometheus text 형식 출력
+    def render(self):
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+        lines = []
+        with self.lock:
+            names = sorted({name for name, _ in self.histograms})
+            for name in names:
+                lines.append(f"# TYPE cam_{name} histogram")
+                for (n, labels), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, c in zip(hist.buckets, hist.counts):
+                        cumulative += c
+                        lines.append(f"cam_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"cam_{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"cam_{name}_sum{fmt(labels)} {hist.sum:.6f}")
+                    lines.append(f"cam_{name}_count{fmt(labels)} {hist.count}")
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE cam_{name} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"cam_{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+trigger_ids = itertools.count(1)
+
+# 트리거 1건의 구간별 소요 시간 기록 (capture, encode, upload, inference, reply)
+class Trace:
+    def __init__(self, station, started=None, seq=None, line=None, config=None):
+        self.id = next(trigger_ids)
+        self.station = station
+        self.line = line or DEFAULT_LINE
+        self.config = config or station_config(station)      # 스테이션 설정 (카메라, 서버, 응답 ...)
+        # 로그/메트릭/캐시 키: 기본 라인은 스테이션 이름 그대로, 다른 라인은 "라인/스테이션"
+        self.label = station if self.line == DEFAULT_LINE else f"{self.line}/{station}"
+        self.started = started if started is not None else time.monotonic()
+        self.seq = seq          # framed 프로토콜의 트리거 순번 (응답에 그대로 사용)
+        self.deadline = None    # 파이프라인 모드: 분류 명령을 보내야 하는 시각 (monotonic)
+        self.verdict = None     # 응답에 쓴 판정 라벨 (판정 없음/실패는 None, 파이프라인 분류에 사용)
+        self.spans = {}
+        self.notes = {} if seq is None else {"seq": seq}
+
+    # 구간 시간 외에 함께 남길 값 (예: 노출 안정화 시간)
+    def note(self, key, value):
+        self.notes[key] = value
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - t0
+            self.spans[stage] = self.spans.get(stage, 0.0) + elapsed
+            metrics.observe("stage_seconds", elapsed, station=self.label, stage=stage)
+
+    # 서버 지연 예산: 파이프라인 모드에서는 부품이 분류기에 도착하기 전까지로 제한
+    def budget(self, default):
+        if self.deadline is None:
+            return default
+        return max(0.0, min(default, self.deadline - time.monotonic()))
+
+    # 트리거 도착부터 응답까지 전체 시간 기록
+    def finish(self, outcome):
+        total = time.monotonic() - self.started
+        metrics.observe("trigger_seconds", total, station=self.label)
+        metrics.inc("triggers_total", station=self.label, outcome=outcome)
+        metrics.mark_done(self.label)
+        spans = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.spans.items())
+        notes = "".join(f" {k}={v}" for k, v in self.notes.items())
+        print(f"[TRACE] {self.label} #{self.id} {outcome} {spans} total={total * 1000:.1f}ms{notes}")
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+# /metrics 엔드포인트 시작
+def start_metrics_server(addr=METRICS_ADDR):
+    if not addr:
+        return None
+    try:
+        server = ThreadingHTTPServer(addr, MetricsHandler)
+    except OSError as e:
+        print("[!] Metrics server failed:", e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[*] Metrics: http://{addr[0]}:{addr[1]}/metrics")
+    return server
+
+# ─────────────────────────────
+# 시리얼 프로토콜
+# framed 프레임: SOF(0xA5) | 길이(1) | 순번(2, LE) | 타임스탬프 ms(4, LE) | 본문(길이) | CRC16(2, LE)
+# CRC16 은 CCITT-FALSE (초기값 0xFFFF), 길이 바이트부터 본문 끝까지 계산
+# 응답 프레임의 순번은 응답 대상 트리거의 순번을 그대로 사용
+
+SERIAL_MAX_LINE = 1024              # 줄바꿈 없이 이보다 길게 쌓이면 버림 (텍스트 모드)
+FRAME_SOF = 0xA5
+FRAME_HEADER = struct.Struct("<BBHI")
+FRAME_CRC = struct.Struct("<H")
+FRAME_OVERHEAD = FRAME_HEADER.size + FRAME_CRC.size
+FRAME_MAX_PAYLOAD = 64              # 본문 최대 길이, 넘으면 잘못 잡힌 SOF 로 판단
+FRAME_STALL_TIMEOUT = 0.05          # 미완성 프레임을 기다리는 최대 시간 (초), 넘으면 재동기화
+FRAME_DUP_WINDOW = 16               # 중복 판단에 기억하는 최근 순번 수
+
+# 수신 메시지 (seq/ts 는 텍스트 모드에서 None, arrived 는 수신 시각 monotonic)
+Message = collections.namedtuple("Message", "text seq ts arrived")
+
+def frame_timestamp():
+    return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+# 명령이 아닌 줄(펌웨어 상태 출력 등)은 디코딩/출력 없이 개수만 집계
+def count_chatter(codec, chatter):
+    if chatter:
+        codec.stats["chatter"] += chatter
+        metrics.inc("serial_chatter_total", chatter)
+
+# 기존 펌웨어용: 줄 단위 문자열
+# commands 를 주면 해당 명령(":" 앞부분 기준) 줄만 메시지로 만들고 나머지는 잡담(chatter)으로 버림
+class TextCodec:
+    framed = False
+
+    def __init__(self, commands=None):
+        self.buffer = bytearray()
+        self.stats = collections.Counter()
+        self.commands = None if commands is None else {c.encode() for c in commands}
+
+    def encode(self, data, seq=None):
+        return data
+
+    def reset(self):
+        del self.buffer[:]
+
+    # 받은 조각을 한 번에 줄 단위로 나눔 (줄마다 find/decode 반복하지 않음)
+    def feed(self, data, arrived=None):
+        arrived = arrived if arrived is not None else time.monotonic()
+        buf = self.buffer
+        buf += data
+        end = buf.rfind(b"\n")
+        if end < 0:
+            if len(buf) > SERIAL_MAX_LINE:
+                self.stats["junk_bytes"] += len(buf)
+                del buf[:]
+            return []
+        lines = bytes(buf[:end]).split(b"\n")
+        del buf[:end + 1]
+        messages = []
+        chatter = 0
+        for raw in lines:
+            raw = raw.strip()
+            if not raw:
+                continue
+            if self.commands is not None and raw.partition(b":")[0] not in self.commands:
+                chatter += 1
+                continue
+            messages.append(Message(raw.decode(errors='ignore'), None, None, arrived))
+        count_chatter(self, chatter)
+        self.stats["messages"] += len(messages)
+        return messages
+
+# 길이/순번/체크섬/타임스탬프 프레임, 깨진 바이트는 건너뛰고 다음 SOF 에서 다시 동기화
+class FramedCodec:
+    framed = True
+
+    def __init__(self, commands=None):
+        self.buffer = bytearray()
+        self.stats = collections.Counter()
+        self.commands = None if commands is None else {c.encode() for c in commands}
+        self.recent = collections.deque(maxlen=FRAME_DUP_WINDOW)
+        self.last_seq = None
+        self.next_seq = itertools.count()
+        self.pending_since = None   # 미완성 프레임 대기 시작 시각
+
+    # 상대가 재부팅했으면 순번이 처음부터 다시 시작하므로 추적 초기화
+    def reset(self):
+        del self.buffer[:]
+        self.recent.clear()
+        self.last_seq = None
+        self.pending_since = None
+
+    # 응답 대상 트리거 순번이 없으면 자체 순번 사용
+    def encode(self, data, seq=None):
+        payload = data.rstrip(b"\r\n")
+        if len(payload) > FRAME_MAX_PAYLOAD:
+            raise ValueError(f"Frame payload too long: {len(payload)} bytes")
+        if seq is None:
+            seq = next(self.next_seq)
+        header = FRAME_HEADER.pack(FRAME_SOF, len(payload), seq & 0xFFFF, frame_timestamp())
+        crc = binascii.crc_hqx(payload, binascii.crc_hqx(header[1:], 0xFFFF))
+        return header + payload + FRAME_CRC.pack(crc)
+
+    def feed(self, data, arrived=None):
+        arrived = arrived if arrived is not None else time.monotonic()
+        buf = self.buffer
+        buf += data
+        messages = []
+        chatter = 0
+        pos = 0
+        while True:
+            start = buf.find(FRAME_SOF, pos)
+            if start < 0:
+                self.stats["junk_bytes"] += len(buf) - pos
+                pos = len(buf)
+                break
+            self.stats["junk_bytes"] += start - pos
+            pos = start
+            if len(buf) - pos < FRAME_HEADER.size:
+                break
+            _, length, seq, ts = FRAME_HEADER.unpack_from(buf, pos)
+            end = pos + FRAME_HEADER.size + length
+            if length <= FRAME_MAX_PAYLOAD and len(buf) < end + FRAME_CRC.size:
+                # 잘못 잡힌 SOF 가 긴 길이를 가리키면 다음 데이터가 올 때까지 막히므로 대기 시간 제한
+                if self.pending_since is None:
+                    self.pending_since = arrived
+                if arrived - self.pending_since <= FRAME_STALL_TIMEOUT:
+                    break
+                self.stats["stalls"] += 1
+                self.pending_since = None
+                pos += 1
+                continue
+            self.pending_since = None
+            if length > FRAME_MAX_PAYLOAD or binascii.crc_hqx(memoryview(buf)[pos + 1:end], 0xFFFF) != FRAME_CRC.unpack_from(buf, end)[0]:
+                # SOF 로 보였던 바이트가 본문 일부였을 수 있으므로 한 바이트만 건너뛰고 재탐색
+                self.stats["crc_errors"] += 1
+                metrics.inc("serial_frames_total", result="crc_error")
+                pos += 1
+                continue
+            pos = end + FRAME_CRC.size
+            # 잡담 프레임도 순번 추적에는 포함 (유실 판단)
+            if not self._track(seq):
+                continue
+            payload = bytes(buf[start + FRAME_HEADER.size:end]).strip()
+            if self.commands is not None and payload.partition(b":")[0] not in self.commands:
+                chatter += 1
+                continue
+            messages.append(Message(payload.decode(errors='ignore'), seq, ts, arrived))
+        del buf[:pos]
+        count_chatter(self, chatter)
+        self.stats["messages"] += len(messages)
+        return messages
+
+    # 순번 확인: 최근에 본 순번이면 중복(False), 건너뛴 순번은 유실로 집계
+    def _track(self, seq):
+        if seq in self.recent:
+            self.stats["duplicates"] += 1
+            metrics.inc("serial_frames_total", result="duplicate")
+            return False
+        if self.last_seq is not None:
+            gap = (seq - self.last_seq) & 0xFFFF
+            if 1 < gap < 0x8000:
+                self.stats["lost"] += gap - 1
+                metrics.inc("serial_frames_total", gap - 1, result="lost")
+        self.last_seq = seq
+        self.recent.append(seq)
+        return True
+
+def make_codec(protocol=None, commands=None):
+    protocol = protocol or SERIAL_PROTOCOL
+    if protocol == "framed":
+        return FramedCodec(commands)
+    if protocol == "text":
+        return TextCodec(commands)
+    raise ValueError(f"Unknown serial protocol: {protocol}")
 
 # ─────────────────────────────
 # 시리얼 포트 열기
-def open_serial():
+
+# 포트 한 번 열기 (DTR 을 내린 채 열면 아두이노가 리셋되지 않아 부팅 대기가 필요 없음)
+def connect_serial(port=None):
+    port = port or PORT
+    baud = FRAMED_BAUD if SERIAL_PROTOCOL == "framed" else BAUD
+    ser = serial.Serial()
+    ser.port = port
+    ser.baudrate = baud
+    ser.timeout = SERIAL_TIMEOUT
+    if not SERIAL_RESET_ON_OPEN:
+        ser.dtr = False
+    ser.open()
+    if SERIAL_RESET_ON_OPEN:
+        time.sleep(SERIAL_BOOT_WAIT)
+    ser.reset_input_buffer()
+    print(f"[*] Serial connected: {port} ({baud} baud, {SERIAL_PROTOCOL})")
+    return ser
+
+# 포트 장치 파일이 다시 생길 때까지 대기 (pyudev 이벤트 또는 짧은 주기 폴링)
+udev_monitor = None
+udev_lock = threading.Lock()
+
+# udev tty 이벤트 감시자: 재연결마다 새로 만들지 않고 프로세스에 하나만 두고 재사용
+def get_udev_monitor():
+    global udev_monitor
+    with udev_lock:
+        if udev_monitor is None:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by("tty")
+            monitor.start()
+            udev_monitor = monitor
+        return udev_monitor
+
+def wait_for_port(port=None):
+    port = port or PORT
+    monitor = None
+    if PYUDEV_AVAILABLE and not os.path.exists(port):
+        try:
+            monitor = get_udev_monitor()
+        except Exception as e:
+            print("[!] udev monitor unavailable, polling:", e)
+            monitor = None
+    while not os.path.exists(port):
+        if monitor is not None:
+            monitor.poll(timeout=0.5)
+        else:
+            time.sleep(SERIAL_RECONNECT_POLL)
+
+def open_serial(port=None):
+    port = port or PORT
     while True:
         try:
-            ser = serial.Serial(PORT, BAUD, timeout=1)
-            time.sleep(2)
-            ser.reset_input_buffer()
-            print(f"[*] Serial connected: {PORT}")
-            return ser
-        except SerialException as e:
-            print("[!] Serial open failed, retrying in 3s:", e)
-            time.sleep(3)
-
-# 카메라로 이미지 캡처
-def capture_image(index):
+            return connect_serial(port)
+        except (SerialException, OSError) as e:
+            print("[!] Serial open failed, waiting for port:", e)
+            time.sleep(SERIAL_RECONNECT_POLL)
+            wait_for_port(port)
+
+# 재연결 시 다시 보낼 응답 기록
+# 전송 실패한 응답과, framed 모드에서 아직 ACK 를 받지 못한 응답을 보관
+# ACK 대기 목록은 이 링크에서 ACK 를 한 번이라도 받은 뒤부터 사용
+# (ACK 를 보내지 않는 펌웨어에 재연결마다 이미 처리한 분류/GO 응답을 다시 보내지 않도록)
+class ReplyLog:
+    def __init__(self, max_unacked=32):
+        self.unacked = collections.OrderedDict()   # 순번 → (데이터, 전송 시각)
+        self.backlog = []                           # (데이터, 순번, 실패 시각)
+        self.max_unacked = max_unacked
+        self.acks_seen = False
+        self.lock = threading.Lock()
+
+    def sent(self, data, seq):
+        if seq is None or not self.acks_seen:
+            return
+        with self.lock:
+            self.unacked[seq] = (data, time.monotonic())
+            while len(self.unacked) > self.max_unacked:
+                self.unacked.popitem(last=False)
+
+    def failed(self, data, seq):
+        with self.lock:
+            self.backlog.append((data, seq, time.monotonic()))
+
+    def ack(self, seq):
+        with self.lock:
+            self.acks_seen = True
+            self.unacked.pop(seq, None)
+
+    # 다시 보낼 (데이터, 순번) 목록, 오래된 응답은 버림 (이미 지나간 부품에 대한 판정일 수 있음)
+    def take_replay(self):
+        now = time.monotonic()
+        with self.lock:
+            items = [(data, seq, t) for seq, (data, t) in self.unacked.items()] + self.backlog
+            self.unacked.clear()
+            self.backlog = []
+        items.sort(key=lambda item: item[2])
+        fresh = [(data, seq) for data, seq, t in items if now - t <= SERIAL_REPLAY_MAX_AGE]
+        if len(fresh) < len(items):
+            metrics.inc("serial_replies_total", len(items) - len(fresh), result="expired")
+        return fresh
+
+    def __len__(self):
+        with self.lock:
+            return len(self.unacked) + len(self.backlog)
+
+# framed 펌웨어의 "ACK:<순번>" 이면 순번 반환
+def parse_ack(message):
+    name, _, value = message.text.partition(":")
+    if name != SERIAL_ACK:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+# 카메라 장치 열기 (해상도 설정 포함)
+def open_capture(index):
     cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
     if not cap.isOpened():
+        cap.release()
         raise RuntimeError(f"Camera {index} open failed")
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, RESOLUTION[0])
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, RESOLUTION[1])
-    time.sleep(0.7)
-    ok, frame = cap.read()
-    cap.release()
-    return frame if ok else None
-
-# 이미지 JPEG 인코딩
-def encode_jpeg(frame):
-    ok, buf = cv2.imencode('.jpg', frame)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    if CAM_MJPEG_PASSTHROUGH:
+        # 카메라가 실제로 MJPG 를 받아들였을 때만 V4L2 백엔드의 디코딩을 끄고 JPEG 버퍼를 그대로 반환
+        # (YUYV 등으로 남아 있으면 변환을 끄면 2채널 원본이 나오므로 디코딩된 BGR 그대로 사용)
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        if fourcc == cv2.VideoWriter_fourcc(*'MJPG'):
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        else:
+            name = fourcc.to_bytes(4, "little").decode("ascii", errors="replace")
+            print(f"[!] Camera {index} did not accept MJPG (format {name!r}), using decoded BGR frames")
+    return cap
+
+# 캡처 프레임: JPEG 원본 또는 디코딩된 이미지, 픽셀은 필요할 때만 디코딩
+class Frame:
+    def __init__(self, image=None, jpeg=None):
+        self._image = image
+        self.jpeg = jpeg
+        self._thumb = None
+        self.settle_time = None     # 이 프레임을 낸 카메라의 마지막 노출 안정화 시간 (초)
+        self.timestamp = None       # 촬영 시각 (monotonic 초, 가능하면 V4L2 버퍼 타임스탬프)
+
+    # cap.read() 결과가 MJPG 원본 버퍼면 JPEG 로, 아니면 이미지로 보관
+    @classmethod
+    def from_capture(cls, data):
+        if data.ndim == 1 or (data.ndim == 2 and data.shape[0] == 1):
+            jpeg = data.tobytes()
+            if jpeg[:2] == b"\xff\xd8":
+                end = jpeg.rfind(b"\xff\xd9")
+                return cls(jpeg=jpeg[:end + 2] if end > 0 else jpeg)
+        return cls(image=data)
+
+    @property
+    def image(self):
+        if self._image is None and self.jpeg is not None:
+            self._image = cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return self._image
+
+    @property
+    def decoded(self):
+        return self._image is not None
+
+    # 1/scale 크기 흑백 썸네일 (밝기/선명도 등 빠른 계산용), JPEG 는 축소 디코딩으로 바로 생성
+    def thumbnail(self, scale=8):
+        if self._thumb is None:
+            self._thumb = {}
+        if scale not in self._thumb:
+            if self._image is None and self.jpeg is not None:
+                flag = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                        8: cv2.IMREAD_REDUCED_GRAYSCALE_8}[scale]
+                thumb = cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), flag)
+            else:
+                h, w = self.image.shape[:2]
+                small = cv2.resize(self.image, (max(1, w // scale), max(1, h // scale)), interpolation=cv2.INTER_AREA)
+                thumb = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+            self._thumb[scale] = thumb
+        return self._thumb[scale]
+
+# 평균 밝기와 선명도(라플라시안 분산), 썸네일 기준
+def frame_stats(frame):
+    thumb = frame.thumbnail()
+    return float(thumb.mean()), float(cv2.Laplacian(thumb, cv2.CV_32F).var())
+
+# 초점 점수: 1/4 흑백 이미지의 라플라시안 분산 (클수록 선명)
+def focus_score(frame):
+    return float(cv2.Laplacian(frame.thumbnail(4), cv2.CV_32F).var())
+
+# 여러 프레임 중 가장 선명한 프레임과 점수
+def sharpest_frame(frames):
+    scores = [focus_score(f) for f in frames]
+    best = max(range(len(frames)), key=scores.__getitem__)
+    return frames[best], scores[best]
+
+# 연속 프레임의 밝기/선명도가 수렴하면 노출 안정화 완료로 판단 (최대 SETTLE_MAX)
+class SettleDetector:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.prev = None
+        self.stable = 0
+
+    def update(self, frame):
+        mean, sharp = frame_stats(frame)
+        if self.prev is not None:
+            prev_mean, prev_sharp = self.prev
+            d_mean = abs(mean - prev_mean) / max(prev_mean, 1.0)
+            d_sharp = abs(sharp - prev_sharp) / max(prev_sharp, 1e-6)
+            if d_mean < SETTLE_TOLERANCE[0] and d_sharp < SETTLE_TOLERANCE[1]:
+                self.stable += 1
+            else:
+                self.stable = 0
+        self.prev = (mean, sharp)
+        return self.stable >= SETTLE_STABLE_FRAMES or self.elapsed() >= SETTLE_MAX
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+# 프레임 촬영 시각: V4L2 버퍼 타임스탬프(CLOCK_MONOTONIC, ms)를 쓰고, 없거나 어긋나면 수신 시각 사용
+def capture_timestamp(cap, received):
+    try:
+        ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+    except Exception:
+        ms = 0
+    if ms and 0 <= received - ms / 1000 < CAM_TIMESTAMP_MAX_SKEW:
+        return ms / 1000, True
+    return received, False
+
+# 카메라를 계속 열어두고 백그라운드 스레드에서 최신 프레임을 유지
+class CameraStream:
+    def __init__(self, index, buffer_size=CAM_BUFFER_SIZE):
+        self.index = index
+        self.frames = collections.deque(maxlen=buffer_size)   # (촬영 시각, Frame)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.cap = None
+        self.fps = 0.0                 # 프레임 간격으로 계산한 이동 평균 FPS
+        self.last_frame_time = None    # 마지막으로 내보낸(노출 안정 후) 프레임 시각
+        self.last_read_time = None     # 장치에서 마지막으로 읽은 프레임 시각 (안정 대기 중 포함)
+        self.settling = False          # 노출 안정 대기 중 (프레임은 들어오지만 아직 내보내지 않음)
+        self.read_errors = 0
+        self.open_errors = 0
+        self.reopens = 0
+        self.settle_time = None
+        self.hw_timestamps = False     # 드라이버 타임스탬프 사용 여부
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name=f"cam{self.index}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+        self._release()
+
+    def _release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    # 프레임 수신 루프: 실패 시 장치를 닫고 자동 재연결
+    def _loop(self):
+        settle = None
+        while self.running:
+            if self.cap is None:
+                try:
+                    self.cap = open_capture(self.index)
+                    settle = SettleDetector()
+                    print(f"[*] Camera {self.index} opened")
+                except Exception as e:
+                    self.open_errors += 1
+                    print(f"[!] Camera {self.index} open failed, retrying:", e)
+                    time.sleep(CAM_REOPEN_DELAY)
+                    continue
+
+            ok, frame = self.cap.read()
+            if not ok or frame is None:
+                self.read_errors += 1
+                self.reopens += 1
+                print(f"[!] Camera {self.index} read failed, reopening")
+                self._release()
+                time.sleep(CAM_REOPEN_DELAY)
+                continue
+
+            now = time.monotonic()
+            self.last_read_time = now
+            stamp, self.hw_timestamps = capture_timestamp(self.cap, now)
+            frame = Frame.from_capture(frame)
+            frame.timestamp = stamp
+            # 노출이 안정될 때까지는 프레임을 내보내지 않음
+            if settle is not None:
+                if not settle.update(frame):
+                    self.settling = True
+                    continue
+                self.settling = False
+                self.settle_time = settle.elapsed()
+                metrics.observe("camera_settle_seconds", self.settle_time, camera=str(self.index))
+                print(f"[*] Camera {self.index} settled in {self.settle_time * 1000:.0f} ms")
+                settle = None
+            frame.settle_time = self.settle_time
+
+            with self.cond:
+                if self.last_frame_time is not None:
+                    interval = now - self.last_frame_time
+                    if interval > 0:
+                        self.fps = 1 / interval if self.fps == 0 else 0.9 * self.fps + 0.1 / interval
+                self.last_frame_time = now
+                self.frames.append((stamp, frame))
+                self.seq += 1
+                self.cond.notify_all()
+        self._release()
+
+    # 호출 이후에 들어온 새 프레임 반환 (오래된 버퍼 프레임 방지)
+    def read(self, timeout=CAM_READ_TIMEOUT):
+        with self.cond:
+            target = self.seq + 1
+            if not self.cond.wait_for(lambda: self.seq >= target, timeout):
+                return None
+            return self.frames[-1][1]
+
+    # 호출 이후 새로 들어온 프레임 n장을 순서대로 반환 (시간 초과 시 받은 만큼)
+    def read_burst(self, n, timeout=CAM_READ_TIMEOUT):
+        frames = []
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            last = self.seq
+            while len(frames) < n:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.cond.wait_for(lambda: self.seq > last, remaining):
+                    break
+                new = min(self.seq - last, len(self.frames))
+                frames.extend(f for _, f in list(self.frames)[-new:])
+                last = self.seq
+        return frames[:n]
+
+    # 목표 시각에 가장 가까운 프레임 n장을 촬영 순서로 반환 (링버퍼에서 선택)
+    # 목표 시각 이후 프레임이 아직 없을 때만 기다림, 가장 가까운 프레임도 timeout 이상 떨어져 있으면 빈 목록
+    # 가장 가까운 프레임도 CAM_ALIGN_MAX_SKEW 프레임 간격보다 멀면 [] (링버퍼 밖의 시각, 벨트는 이미 움직임)
+    def read_at(self, target, n=1, timeout=CAM_READ_TIMEOUT):
+        with self.cond:
+            self.cond.wait_for(lambda: self.frames and self.frames[-1][0] >= target,
+                               max(0.0, target - time.monotonic()) + timeout)
+            ranked = sorted(self.frames, key=lambda item: abs(item[0] - target))[:n]
+            max_skew = CAM_ALIGN_MAX_SKEW / self.fps if self.fps > 0 else timeout
+        if not ranked or abs(ranked[0][0] - target) > max_skew:
+            return []
+        return [f for _, f in sorted(ranked, key=lambda item: item[0])]
+
+    # 대기 없이 가장 최근 프레임 반환
+    def latest(self):
+        with self.cond:
+            return self.frames[-1][1] if self.frames else None
+
+    # 캡처 루프 기록만으로 판단한 상태 (장치를 건드리지 않음)
+    # 프레임은 읽히지만 아직 노출 안정 대기 중이면 "settling" (쓸 수 있는 프레임이 없으므로 ok 아님)
+    def health(self):
+        with self.cond:
+            now = time.monotonic()
+            age = None if self.last_frame_time is None else now - self.last_frame_time
+            read_age = None if self.last_read_time is None else now - self.last_read_time
+            if self.settling and read_age is not None and read_age < CAM_STALE_AFTER:
+                status = "settling"
+            else:
+                status = "ok" if age is not None and age < CAM_STALE_AFTER else "fail"
+            return {
+                "status": status,
+                "last_frame_age": None if age is None else round(age, 3),
+                "fps": round(self.fps, 1),
+                "frames": self.seq,
+                "read_errors": self.read_errors,
+                "open_errors": self.open_errors,
+                "reopens": self.reopens,
+                "settle_time": None if self.settle_time is None else round(self.settle_time, 3),
+                "hw_timestamps": self.hw_timestamps,
+            }
+
+cameras = {}
+cameras_lock = threading.Lock()
+
+# 카메라 스트림 조회 (없으면 생성 후 시작)
+def get_camera(index):
+    with cameras_lock:
+        cam = cameras.get(index)
+        if cam is None:
+            cam = cameras[index] = CameraStream(index).start()
+        return cam
+
+# 카메라로 프레임 캡처 (MJPG 원본이면 디코딩하지 않음)
+def capture_frame(index):
+    frame = get_camera(index).read()
+    if frame is None:
+        raise RuntimeError(f"Camera {index} frame timeout")
+    return frame
+
+# 연속 촬영 (burst)
+def capture_burst(index, n):
+    frames = get_camera(index).read_burst(n, timeout=CAM_READ_TIMEOUT + n * 0.1)
+    if not frames:
+        raise RuntimeError(f"Camera {index} frame timeout")
+    return frames
+
+# 트리거 시각에 맞춘 캡처: 목표 시각에 가장 가까운 프레임 n장 (새 노출을 기다리지 않음)
+# 트리거 시각 근처 프레임이 링버퍼에 없으면(작업 스레드가 늦게 시작 등) 새 프레임으로 대체
+def capture_aligned(index, target, n=1):
+    frames = get_camera(index).read_at(target, n)
+    if frames:
+        return frames
+    metrics.inc("capture_unaligned_total", camera=str(index))
+    print(f"[!] Camera {index} has no frame near trigger time "
+          f"({(time.monotonic() - target) * 1000:.0f}ms ago), capturing a fresh one")
+    return capture_burst(index, n) if n > 1 else [capture_frame(index)]
+
+# ─────────────────────────────
+# 프레임 품질 검사 (어두움/과노출/대비/블러/멈춘 프레임)
+
+class QualityGate:
+    def __init__(self, rules=None):
+        self.rules = rules
+        self.prev = {}          # 스테이션 → 직전 통과 프레임 썸네일
+        self.lock = threading.Lock()
+
+    # (통과 여부, 불합격 사유) 반환, 밝기/대비는 썸네일 히스토그램으로 계산
+    def check(self, station, frame):
+        rules = self.rules if self.rules is not None else QUALITY_GATE
+        if not rules:
+            return True, None
+        thumb = frame.thumbnail(8)
+        hist = cv2.calcHist([thumb], [0], None, [256], [0, 256]).ravel()
+        total = max(hist.sum(), 1.0)
+        levels = np.arange(256, dtype=np.float64)
+        mean = float((hist * levels).sum() / total)
+        std = float(np.sqrt((hist * (levels - mean) ** 2).sum() / total))
+        clipped = float((hist[:5].sum() + hist[251:].sum()) / total)
+
+        if mean < rules["min_brightness"]:
+            return False, "dark"
+        if mean > rules["max_brightness"]:
+            return False, "overexposed"
+        if std < rules["min_contrast"]:
+            return False, "low_contrast"
+        if clipped > rules["max_clipped"]:
+            return False, "clipped"
+        if focus_score(frame) < rules["min_focus"]:
+            return False, "blur"
+        with self.lock:
+            prev = self.prev.get(station)
+        if prev is not None and prev.shape == thumb.shape:
+            if float(cv2.absdiff(thumb, prev).mean()) < rules["min_diff"]:
+                return False, "stale"
+        return True, None
+
+    def accept(self, station, frame):
+        with self.lock:
+            self.prev[station] = frame.thumbnail(8)
+
+quality_gate = QualityGate()
+
+# 스테이션 캡처: burst > 1 이면 연속 N장 중 가장 선명한 프레임 선택, 측정값은 trace 에 기록
+# 첫 촬영은 트리거 도착 시각(- CAM_TRIGGER_OFFSET)에 가장 가까운 링버퍼 프레임 사용
+# 품질 검사 불합격이면 라이브 스트림에서 다시 촬영, 끝까지 불합격이면 None
+def capture_for_station(index, trace, burst=1):
+    target = trace.started - CAM_TRIGGER_OFFSET.get(index, 0.0)
+    for attempt in range(QUALITY_RETRIES + 1):
+        with trace.span("capture"):
+            # 첫 촬영은 트리거 시각 프레임, 품질 불합격 후 재촬영은 새 프레임
+            if attempt == 0 and CAM_TRIGGER_ALIGN:
+                frames = capture_aligned(index, target, burst)
+            else:
+                frames = capture_burst(index, burst) if burst > 1 else [capture_frame(index)]
+        frame = frames[0]
+        if len(frames) > 1:
+            with trace.span("focus"):
+                frame, score = sharpest_frame(frames)
+            trace.note("burst", len(frames))
+            trace.note("focus", round(score, 1))
+        if frame.timestamp is not None:
+            # 트리거 도착 기준 촬영 시각 (음수 = 도착 전 프레임), 보정값 조정에 사용
+            trace.note("frame_ms", round((frame.timestamp - trace.started) * 1000))
+            if attempt == 0 and CAM_TRIGGER_ALIGN:
+                metrics.observe("capture_skew_seconds", abs(frame.timestamp - target), camera=str(index))
+        if frame.settle_time is not None:
+            trace.note("settle_ms", round(frame.settle_time * 1000))
+
+        with trace.span("quality"):
+            ok, reason = quality_gate.check(trace.label, frame)
+        if ok:
+            quality_gate.accept(trace.label, frame)
+            metrics.inc("quality_gate_total", station=trace.label, result="pass")
+            if attempt:
+                trace.note("recaptures", attempt)
+            return frame
+        metrics.inc("quality_gate_total", station=trace.label, result=reason)
+        print(f"[!] {trace.label} #{trace.id} frame rejected ({reason}), attempt {attempt + 1}")
+    trace.note("rejected", reason)
+    return None
+
+# 카메라로 이미지 캡처 (디코딩된 BGR 이미지)
+def capture_image(index):
+    return capture_frame(index).image
+
+# ─────────────────────────────
+# JPEG 인코딩 (프로필별 품질/서브샘플링, simplejpeg 또는 OpenCV)
+
+SAMPLING_FACTORS = {
+    "420": getattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR_420", None),
+    "422": getattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR_422", None),
+    "444": getattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR_444", None),
+}
+
+def _encode_opencv(image, quality, subsampling, progressive):
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_PROGRESSIVE, int(progressive)]
+    factor = SAMPLING_FACTORS.get(subsampling)
+    if factor is not None and hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+        params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+    ok, buf = cv2.imencode('.jpg', image, params)
     return buf.tobytes() if ok else None
 
+def _encode_simplejpeg(image, quality, subsampling):
+    return simplejpeg.encode_jpeg(np.ascontiguousarray(image), quality=quality,
+                                  colorspace='BGR', colorsubsampling=subsampling, fastdct=True)
+
+# BGR 이미지를 프로필 설정으로 인코딩 (simplejpeg 는 progressive 미지원 → OpenCV 사용)
+def encode_image(image, profile="archive", backend=None):
+    cfg = JPEG_PROFILES[profile]
+    backend = backend or JPEG_BACKEND
+    use_simple = SIMPLEJPEG_AVAILABLE and backend in ("auto", "simplejpeg") and not cfg["progressive"]
+    if use_simple:
+        return _encode_simplejpeg(image, cfg["quality"], cfg["subsampling"])
+    return _encode_opencv(image, cfg["quality"], cfg["subsampling"], cfg["progressive"])
+
+# 이미지 JPEG 인코딩 (카메라 JPEG 원본이 있으면 그대로 사용)
+def encode_jpeg(frame, profile="archive"):
+    if isinstance(frame, Frame):
+        if frame.jpeg is not None:
+            return frame.jpeg
+        frame = frame.image
+    if frame is None:
+        return None
+    return encode_image(frame, profile)
+
+# 라인별 작업 스레드 풀 (인코딩, 추론 요청)
+# 한 라인에 몰린 요청(파이프라인 모드 + 헤지)이 다른 라인의 지연 예산을 잡아먹지 않도록 라인마다 따로 둠
+class LinePools:
+    def __init__(self, name):
+        self.encode = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix=f"encode-{name}")
+        self.infer = ThreadPoolExecutor(max_workers=INFER_WORKERS, thread_name_prefix=f"infer-{name}")
+
+line_pools = {}
+line_pools_lock = threading.Lock()
+
+# 라인 풀 조회 (없으면 생성)
+def get_pools(line=None):
+    line = line or DEFAULT_LINE
+    with line_pools_lock:
+        if line not in line_pools:
+            line_pools[line] = LinePools(line)
+        return line_pools[line]
+
+# 백그라운드 인코딩 (Future 반환)
+def encode_async(frame, profile="archive", line=None):
+    return get_pools(line).encode.submit(encode_jpeg, frame, profile)
+
+# ─────────────────────────────
+# 추론용 전처리 (ROI 크롭 + 축소), 원본 전체 프레임은 보관용으로 따로 업로드
+
+# 가운데 기준 크롭 (복사 없는 numpy 슬라이스)
+def crop_center(image, size):
+    h, w = image.shape[:2]
+    cw, ch = min(size[0], w), min(size[1], h)
+    x1 = (w - cw) // 2
+    y1 = (h - ch) // 2
+    return image[y1:y1 + ch, x1:x1 + cw]
+
+# 스테이션 설정에 맞춰 추론 입력 생성 (설정이 없으면 프레임 그대로 → JPEG 원본 재사용)
+def prepare_inference_image(frame, station):
+    cfg = PREPROCESS.get(station) or {}
+    if not cfg.get("crop") and not cfg.get("size"):
+        return frame
+    image = frame.image if isinstance(frame, Frame) else frame
+    if cfg.get("crop"):
+        image = crop_center(image, cfg["crop"])
+    size = cfg.get("size")
+    if size and (image.shape[1], image.shape[0]) != tuple(size):
+        image = cv2.resize(image, tuple(size), interpolation=cv2.INTER_AREA)
+    return image
+
 # GCS 업로드 함수
+def gcs_client():
+    # STORAGE_EMULATOR_HOST 가 설정되면 로컬 가짜 GCS 서버 사용 (테스트용)
+    if os.environ.get("STORAGE_EMULATOR_HOST"):
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(project="local", credentials=AnonymousCredentials())
+    return storage.Client.from_service_account_json(GCS_KEY_PATH)
+
+# 프로세스 전체에서 하나의 GCS 클라이언트/버킷을 재사용하는 업로더
+class GCSUploader:
+    def __init__(self, bucket_name=BUCKET_NAME):
+        self.bucket_name = bucket_name
+        self.client = None
+        self.bucket = None
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=1000)   # 업로드별 소요 시간 (초)
+        self.done_times = collections.deque()             # 최근 업로드 완료 시각 (속도 계산용)
+        self.counts = {"uploaded": 0, "failed": 0, "bytes": 0}
+
+    # 최초 사용 시 클라이언트 생성 + 토큰 갱신 스레드 시작
+    def _get_bucket(self):
+        with self.lock:
+            if self.bucket is None:
+                self.client = gcs_client()
+                self.bucket = self.client.bucket(self.bucket_name)
+                threading.Thread(target=self._refresh_loop, name="gcs-token", daemon=True).start()
+            return self.bucket
+
+    # 업로드 경로에서 토큰 갱신이 일어나지 않도록 만료 전에 미리 갱신
+    def _refresh_loop(self):
+        import google.auth.transport.requests
+        request = google.auth.transport.requests.Request()
+        creds = self.client._credentials
+        while True:
+            try:
+                expiry = getattr(creds, "expiry", None)
+                margin = datetime.timedelta(seconds=GCS_TOKEN_REFRESH_MARGIN)
+                if not creds.valid or (expiry and expiry - datetime.datetime.utcnow() < margin):
+                    creds.refresh(request)
+            except Exception as e:
+                print("[!] GCS token refresh failed:", e)
+            time.sleep(60)
+
+    def _record(self, ok, elapsed, size):
+        with self.stats_lock:
+            if ok:
+                now = time.monotonic()
+                self.counts["uploaded"] += 1
+                self.counts["bytes"] += size
+                self.latencies.append(elapsed)
+                self.done_times.append(now)
+                metrics.observe("gcs_upload_seconds", elapsed)
+                while self.done_times and now - self.done_times[0] > GCS_STATS_WINDOW:
+                    self.done_times.popleft()
+            else:
+                self.counts["failed"] += 1
+
+    # 단일 이미지 업로드 (실패 시 예외 발생)
+    # 라이브러리 기본 재시도(최대 120초)를 끄고 제한 시간만 둠: 장애 중 업로드 스레드가 오래 묶이지 않도록
+    def upload(self, image_bytes, filename, folder):
+        blob = self._get_bucket().blob(f"{folder}/{filename}")
+        t0 = time.monotonic()
+        try:
+            blob.upload_from_string(image_bytes, content_type='image/jpeg', timeout=GCS_UPLOAD_TIMEOUT, retry=None)
+        except Exception:
+            self._record(False, time.monotonic() - t0, 0)
+            raise
+        self._record(True, time.monotonic() - t0, len(image_bytes))
+        return blob.public_url
+
+    def _upload_file(self, item):
+        path, filename, folder = item
+        blob = self._get_bucket().blob(f"{folder}/{filename}")
+        t0 = time.monotonic()
+        try:
+            blob.upload_from_filename(path, content_type='image/jpeg', timeout=GCS_UPLOAD_TIMEOUT, retry=None)
+        except Exception as e:
+            self._record(False, time.monotonic() - t0, 0)
+            print(f"[!] GCS upload failed: {folder}/{filename}:", e)
+            return False
+        self._record(True, time.monotonic() - t0, os.path.getsize(path))
+        return True
+
+    # 디스크에 있는 여러 이미지를 병렬 업로드, 항목별 성공 여부 반환
+    def upload_files(self, items, workers=SPOOL_DRAIN_WORKERS):
+        if not items:
+            return []
+        self._get_bucket()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gcs") as pool:
+            return list(pool.map(self._upload_file, items))
+
+    # 업로드 건수, 초당 업로드 수, 지연 시간 백분위 (ms)
+    def stats(self):
+        with self.stats_lock:
+            stats = dict(self.counts)
+            latencies = sorted(self.latencies)
+            now = time.monotonic()
+            recent = [t for t in self.done_times if now - t <= GCS_STATS_WINDOW]
+        stats["uploads_per_sec"] = round(len(recent) / GCS_STATS_WINDOW, 3)
+        for q in (50, 95, 99):
+            v = percentile(latencies, q)
+            stats[f"latency_p{q}_ms"] = round(v * 1000, 1) if v is not None else None
+        return stats
+
+gcs = GCSUploader()
+
 def upload_to_gcs(image_bytes, filename, folder):
     try:
-        client = storage.Client.from_service_account_json(GCS_KEY_PATH)
-        bucket = client.bucket(BUCKET_NAME)
-        blob = bucket.blob(f"{folder}/{filename}")
-        blob.upload_from_string(image_bytes, content_type='image/jpeg')
+        url = gcs.upload(image_bytes, filename, folder)
         print(f"[GCS] Uploaded: gs://{BUCKET_NAME}/{folder}/{filename}")
-        return blob.public_url
+        return url
     except Exception as e:
         print("[!] GCS upload failed:", e)
         return None
 
-# 이미지 AI 서버로 전송 후 응답 반환
-def post_image_to_server(image_bytes, url, retries=3):
-    for i in range(retries):
+# 업로드 실패 이미지를 디스크에 보관했다가 연결 복구 시 재전송 (재시작 후에도 유지)
+class UploadSpool:
+    def __init__(self, directory=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES, workers=SPOOL_DRAIN_WORKERS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT, filename TEXT, "
+            "folder TEXT, size INTEGER, created REAL)"
+        )
+        self.db.commit()
+        self.counts = {"spooled": 0, "drained": 0, "evicted": 0, "retries": 0}
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self._recover()
+
+    # 인덱스와 실제 파일을 맞춤 (파일 없는 항목, 인덱스에 없는 파일 정리)
+    def _recover(self):
+        with self.lock:
+            rows = self.db.execute("SELECT id, path FROM pending").fetchall()
+            known = set()
+            for row_id, path in rows:
+                if os.path.exists(path):
+                    known.add(os.path.abspath(path))
+                else:
+                    self.db.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+            self.db.commit()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith("index.db") or os.path.abspath(path) in known:
+                continue
+            os.remove(path)
+
+    # 이미지를 보관 폴더에 기록하고 인덱스에 등록
+    def put(self, image_bytes, filename, folder):
+        path = os.path.join(self.directory, f"{time.time_ns()}_{folder}_{filename}")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp, path)
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO pending (path, filename, folder, size, created) VALUES (?, ?, ?, ?, ?)",
+                (path, filename, folder, len(image_bytes), time.time()),
+            )
+            self.counts["spooled"] += 1
+            self._evict()
+            self.db.commit()
+        self.wakeup.set()
+        return True
+
+    # 용량 상한을 넘으면 가장 오래된 항목부터 삭제 (lock 보유 상태에서 호출)
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pending").fetchone()[0]
+        while total > self.max_bytes:
+            row = self.db.execute("SELECT id, path, size FROM pending ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                break
+            row_id, path, size = row
+            self.db.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+            if os.path.exists(path):
+                os.remove(path)
+            total -= size
+            self.counts["evicted"] += 1
+            print(f"[!] Spool full, evicted: {path}")
+
+    def _remove(self, row_id, path):
+        with self.lock:
+            self.db.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+            self.db.commit()
+            self.counts["drained"] += 1
+        if os.path.exists(path):
+            os.remove(path)
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._drain_loop, name="spool-drain", daemon=True)
+        self.thread.start()
+        return self
+
+    # 실시간 업로드가 성공하면 연결이 복구된 것이므로 재전송 대기를 끝내고 바로 시작
+    def wake(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    # 보관된 이미지를 묶음 단위로 병렬 재전송, 실패하면 점점 길게 대기 후 재시도
+    def _drain_loop(self):
+        delay = SPOOL_RETRY_DELAY[0]
+        while self.running:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT id, path, filename, folder FROM pending ORDER BY id LIMIT ?",
+                    (self.workers * 4,),
+                ).fetchall()
+            if not rows:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            # 파일이 사라진 항목은 인덱스에서만 정리
+            missing = [row for row in rows if not os.path.exists(row[1])]
+            if missing:
+                with self.lock:
+                    self.db.executemany("DELETE FROM pending WHERE id = ?", [(row[0],) for row in missing])
+                    self.db.commit()
+                rows = [row for row in rows if row not in missing]
+            results = gcs.upload_files([row[1:] for row in rows], workers=self.workers)
+            for row, ok in zip(rows, results):
+                if ok:
+                    self._remove(row[0], row[1])
+            if all(results):
+                delay = SPOOL_RETRY_DELAY[0]
+                continue
+
+            with self.lock:
+                self.counts["retries"] += 1
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            delay = min(delay * 2, SPOOL_RETRY_DELAY[1])
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            pending, size = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pending"
+            ).fetchone()
+        stats["pending"] = pending
+        stats["bytes"] = size
+        return stats
+
+    def close(self):
+        self.stop()
+        with self.lock:
+            self.db.close()
+
+# 업로드를 검사 흐름에서 분리하는 백그라운드 업로더
+class UploadQueue:
+    def __init__(self, workers=UPLOAD_WORKERS, maxsize=UPLOAD_QUEUE_SIZE, spool=None):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.workers = workers
+        self.spool = spool
+        self.lock = threading.Lock()
+        self.counts = {"submitted": 0, "uploaded": 0, "failed": 0, "spooled": 0, "dropped": 0}
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return self
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"upload{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        return self
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    # 메모리 대기열 대신 디스크 보관소로 넘김, 보관도 실패하면 버림
+    def to_spool(self, image_bytes, filename, folder):
+        if self.spool is not None:
+            try:
+                self.spool.put(image_bytes, filename, folder)
+                self.count("spooled")
+                return True
+            except Exception as e:
+                print("[!] Spool write failed:", e)
+        self.count("dropped")
+        print(f"[!] Upload dropped: {folder}/{filename}")
+        return False
+
+    # 업로드 성공 기록: 네트워크가 살아 있으므로 보관소 재전송을 바로 깨움
+    def uploaded(self):
+        self.count("uploaded")
+        if self.spool is not None:
+            self.spool.wake()
+
+    # 업로드 요청 등록: 대기열이 가득 차면 잠깐 기다린 뒤 보관소로 넘김 (검사 흐름을 막지 않음)
+    def submit(self, image_bytes, filename, folder):
+        try:
+            self.queue.put((image_bytes, filename, folder), timeout=UPLOAD_PUT_TIMEOUT)
+        except queue.Full:
+            return self.to_spool(image_bytes, filename, folder)
+        self.count("submitted")
+        return True
+
+    def _worker(self):
+        while True:
+            image_bytes, filename, folder = self.queue.get()
+            try:
+                if upload_to_gcs(image_bytes, filename, folder):
+                    self.uploaded()
+                else:
+                    self.count("failed")
+                    self.to_spool(image_bytes, filename, folder)
+            finally:
+                self.queue.task_done()
+
+    # 대기열 깊이와 처리 카운터
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats["depth"] = self.queue.qsize()
+        if self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
+
+uploader = UploadQueue()
+
+# 업로드 객체 이름: 밀리초 시각 + 트리거 번호 + 임의값
+# (초당 여러 부품, 여러 라인/프로세스가 같은 폴더에 올려도 서로 덮어쓰지 않도록)
+def archive_name(profile, trace):
+    return f"{profile}_{int(time.time() * 1000)}_{trace.id}_{uuid.uuid4().hex[:6]}.jpg"
+
+# 전체 해상도 프레임을 백그라운드에서 인코딩 후 업로드 대기열에 등록
+def archive_frame(frame, filename, folder, line=None):
+    def done(future):
         try:
-            stream = io.BytesIO(image_bytes)
-            files = {'file': ('image.jpg', stream, 'image/jpeg')}
-            resp = requests.post(url, files=files, timeout=10)
-            if resp.status_code == 200:
-                return resp.json()
-            print(f"[!] Server error {resp.status_code}: {resp.text[:100]}")
+            image_bytes = future.result()
         except Exception as e:
-            print(f"[!] Server request failed ({i+1}/{retries}):", e)
-        time.sleep(0.5)
-    return None
+            print("[!] Archive encoding failed:", e)
+            return
+        if image_bytes:
+            uploader.submit(image_bytes, filename, folder)
+    encode_async(frame, "archive", line).add_done_callback(done)
+
+# 이미지 버퍼를 복사하지 않고 그대로 흘려보내는 multipart/form-data 본문
+class MultipartBody:
+    def __init__(self, image_bytes, boundary, filename="image.jpg"):
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'
+        ).encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        self.parts = [memoryview(head), memoryview(image_bytes), memoryview(tail)]
+        self.length = sum(len(p) for p in self.parts)
+        self.index = 0
+        self.offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    # requests/http.client 가 blocksize 단위로 호출, 원본 버퍼의 memoryview 조각을 반환
+    def read(self, size=-1):
+        if size is None or size < 0:
+            rest = b"".join(self.parts[self.index:])[self.offset:]
+            self.index, self.offset = len(self.parts), 0
+            return rest
+        while self.index < len(self.parts):
+            part = self.parts[self.index]
+            if self.offset < len(part):
+                chunk = part[self.offset:self.offset + size]
+                self.offset += len(chunk)
+                return chunk
+            self.index += 1
+            self.offset = 0
+        return b""
+
+# 서버별 keep-alive 연결을 재사용하는 추론 서버 클라이언트
+class InferenceClient:
+    def __init__(self, pool_size=INFER_POOL_SIZE):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # 시작 시 각 서버로 연결을 미리 맺어둠 (첫 트리거의 TCP 연결 비용 제거)
+    def warm(self, urls, timeout=2):
+        for url in urls:
+            try:
+                self.session.get(url, timeout=timeout)
+            except Exception as e:
+                print(f"[!] Connection warm-up failed: {url}:", e)
+
+    def post_image(self, url, image_bytes, timeout):
+        boundary = uuid.uuid4().hex
+        body = MultipartBody(image_bytes, boundary)
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        return self.session.post(url, data=body, headers=headers, timeout=timeout)
+
+    def get(self, url, timeout):
+        return self.session.get(url, timeout=timeout)
+
+inference = InferenceClient()
+
+# 죽은 서버를 계속 호출하지 않도록 하는 서킷 브레이커
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.fail_count = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    # 차단 중에는 바로 거절, 대기 시간이 지나면 시험 요청 1건만 허용
+    # 시험 요청이 cooldown 안에 결과를 못 내면 (응답 지연 등) 새 시험 요청을 허용
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state = "closed"
+            self.fail_count = 0
+
+    def failure(self):
+        with self.lock:
+            self.fail_count += 1
+            if self.state == "half_open" or self.fail_count >= self.failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+breakers = {}
+breakers_lock = threading.Lock()
+fallback_counts = collections.Counter()
+fallback_lock = threading.Lock()
+
+def get_breaker(url):
+    with breakers_lock:
+        if url not in breakers:
+            breakers[url] = CircuitBreaker()
+        return breakers[url]
+
+# 판정 예산 초과 등으로 기본 동작(GO)을 보낸 횟수 기록
+def record_fallback(station):
+    with fallback_lock:
+        fallback_counts[station] += 1
 
-# SNAP1 처리 (결함 검사)
-def handle_snap1(ser):
+# 서버 1회 요청 (남은 예산을 타임아웃으로 사용)
+# (서버 주소, 응답) 반환, 실패하면 응답은 None (차단기 실패 기록은 post_image_to_server 에서)
+def _request_once(url, image_bytes, deadline):
     try:
-        frame = capture_image(CAM_IR1)
-        image_bytes = encode_jpeg(frame)
-        if not image_bytes:
-            raise ValueError("JPEG encoding failed")
+        timeout = max(0.05, deadline - time.monotonic())
+        resp = inference.post_image(url, image_bytes, timeout=timeout)
+        if resp.status_code == 200:
+            result = resp.json()
+            get_breaker(url).success()
+            return url, result
+        print(f"[!] Server error {resp.status_code}: {resp.text[:100]}")
+    except Exception as e:
+        print(f"[!] Server request failed: {url}:", e)
+    return url, None
+
+# 이미지 AI 서버로 전송 후 응답 반환
+# budget 안에 응답이 없으면 None, 보조 서버가 있으면 HEDGE_DELAY 후 함께 요청
+# 실패하면 INFER_RETRY_DELAY 후 재시도, 차단기에는 호출 1건당 서버별로 한 번만 실패를 기록
+# (한 트리거의 연속 오류만으로 차단기가 열려 다음 부품까지 막지 않도록)
+# 예산 안에 응답하지 못한 서버도 실패로 기록 (멈춘 서버도 차단기가 열리도록)
+def post_image_to_server(image_bytes, url, budget=10.0, retries=3, line=None):
+    deadline = time.monotonic() + budget
+    order = [url] + INFER_REPLICAS.get(url, [])
+    hedging = len(order) > 1
+    pool = get_pools(line).infer
+    pending = {}   # Future → 서버 주소
+    failed = set()
+    attempt = 0
+
+    def launch():
+        nonlocal attempt
+        while attempt < retries:
+            target = order[attempt % len(order)]
+            attempt += 1
+            if get_breaker(target).allow():
+                pending[pool.submit(_request_once, target, image_bytes, deadline)] = target
+                return True
+            print(f"[!] Circuit open, skipped: {target}")
+        return False
+
+    launch()
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"[!] Server deadline exceeded ({budget:.2f}s): {url}")
+                failed.update(pending.values())
+                break
+            done, _ = wait(pending, timeout=min(remaining, HEDGE_DELAY) if hedging else remaining,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                target, result = future.result()
+                if result is not None:
+                    failed.discard(target)
+                    return result
+                failed.add(target)
+            # 실패했으면 잠시 후 재시도 (다른 요청이 진행 중이면 그 응답/헤지 시점까지 대기)
+            if done and not pending:
+                pause = min(INFER_RETRY_DELAY, deadline - time.monotonic())
+                if pause > 0:
+                    time.sleep(pause)
+                launch()
+            elif hedging and not done:
+                launch()
+        return None
+    finally:
+        for target in failed:
+            get_breaker(target).failure()
+
+# ─────────────────────────────
+# 판정 캐시 (같은 부품의 중복 트리거/재검사는 이전 판정 재사용)
+
+# 64비트 차이 해시(dHash): 9x8 흑백 축소 이미지에서 좌우 픽셀 밝기 비교
+def perceptual_hash(image):
+    if isinstance(image, Frame):
+        gray = image.thumbnail(8)
+    else:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
 
-        ts = int(time.time())
-        filename = f"snap1_{ts}.jpg"
+# 판정 재사용은 같은 부품의 재트리거에만: 같은 순번(seq) 재전송이거나,
+# 직전 트리거 후 VERDICT_CACHE_WINDOW 안이고 그 사이 벨트 재개(release)가 없을 때
+# (작은 결함은 dHash 를 거의 바꾸지 않으므로 다음 부품에 판정을 넘겨주면 안 됨)
+class VerdictCache:
+    def __init__(self, size=VERDICT_CACHE_SIZE, window=VERDICT_CACHE_WINDOW, ttl=VERDICT_CACHE_TTL,
+                 distance=VERDICT_CACHE_DISTANCE):
+        self.size = size
+        self.window = window
+        self.ttl = ttl
+        self.distance = distance
+        self.entries = collections.defaultdict(collections.OrderedDict)  # 스테이션 → {해시: (판정, 트리거 시각, 순번)}
+        self.releases = collections.defaultdict(lambda: collections.deque(maxlen=32))   # 스테이션 → 벨트 재개 시각
+        self.lock = threading.Lock()
 
-        if not upload_to_gcs(image_bytes, filename, GCS_FOLDER_SNAP1):
-            ser.write(b"GO\n")
+    # 재트리거로 볼 수 있는 판정 중 해밍 거리가 가장 가까운 것 반환, 없으면 None
+    def get(self, station, key, started, seq=None):
+        if not self.size:
+            return None
+        now = time.monotonic()
+        best, best_distance = None, self.distance + 1
+        with self.lock:
+            entries = self.entries[station]
+            releases = self.releases[station]
+            for k in [k for k, (_, t, _) in entries.items() if now - t > self.ttl]:
+                del entries[k]
+            for k, (verdict, t, s) in entries.items():
+                same_trigger = seq is not None and s == seq
+                retrigger = 0 <= started - t <= self.window and not any(t < r <= started for r in releases)
+                if not (same_trigger or retrigger):
+                    continue
+                d = bin(k ^ key).count("1")
+                if d < best_distance:
+                    best, best_distance = k, d
+            if best is not None:
+                entries.move_to_end(best)
+                verdict = entries[best][0]
+        metrics.inc("verdict_cache_total", station=station, result="hit" if best is not None else "miss")
+        return dict(verdict, cache_distance=best_distance) if best is not None else None
+
+    def put(self, station, key, verdict, started, seq=None):
+        if not self.size:
             return
+        with self.lock:
+            entries = self.entries[station]
+            entries[key] = (verdict, started, seq)
+            entries.move_to_end(key)
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+
+    # 벨트 재개 (파이프라인 모드의 PIPELINE_RELEASE, 정지-재개 모드의 판정 응답): 이전 트리거의 판정은 더 이상 재사용하지 않음
+    def release(self, station):
+        with self.lock:
+            self.releases[station].append(time.monotonic())
+
+    def stats(self):
+        with self.lock:
+            return {station: len(entries) for station, entries in self.entries.items()}
+
+verdict_cache = VerdictCache()
+
+# ─────────────────────────────
+# 로컬 CPU 추론 (결함 검사 예비 판정)
 
-        result = post_image_to_server(image_bytes, URL_SNAP1)
-        label = result.get("label") if result else None
+class LocalModel:
+    def __init__(self, path, input_size=LOCAL_MODEL_INPUT, labels=LOCAL_MODEL_LABELS, workers=LOCAL_MODEL_WORKERS):
+        self.input_size = tuple(input_size)
+        self.labels = labels
+        if ONNXRUNTIME_AVAILABLE:
+            self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+            self.net = None
+        else:
+            self.session = None
+            self.net = cv2.dnn.readNetFromONNX(path)
+        # cv2.dnn 네트워크는 스레드 안전하지 않으므로 풀 크기 1 로 사용
+        self.pool = ThreadPoolExecutor(max_workers=workers if self.session else 1, thread_name_prefix="local")
 
-        if label == "X":
-            ser.write(b"X\n")
-            print("[SNAP1] Defect → sent: X")
+    # BGR 이미지 → 라벨/확률 (softmax)
+    def predict(self, image):
+        t0 = time.monotonic()
+        blob = cv2.dnn.blobFromImage(image, 1 / 255.0, self.input_size, swapRB=True)
+        if self.session is not None:
+            logits = self.session.run(None, {self.input_name: blob})[0]
         else:
-            ser.write(b"GO\n")
-            print("[SNAP1] Normal → sent: GO")
+            self.net.setInput(blob)
+            logits = self.net.forward()
+        logits = np.asarray(logits, dtype=np.float64).ravel()
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        best = int(probs.argmax())
+        elapsed = time.monotonic() - t0
+        metrics.observe("local_inference_seconds", elapsed)
+        return {"label": self.labels[best], "score": float(probs[best]), "source": "local"}
+
+    def submit(self, image):
+        return self.pool.submit(self.predict, image)
+
+local_model = None
+
+# 시작 시 로컬 모델 1회 로드 (실패하면 서버만 사용)
+def load_local_model(path=None):
+    global local_model
+    path = path or LOCAL_MODEL_PATH
+    if not path:
+        return None
+    try:
+        local_model = LocalModel(path)
+        print(f"[*] Local model loaded: {path} ({'onnxruntime' if local_model.session else 'cv2.dnn'})")
     except Exception as e:
-        print("[!] SNAP1 error:", e)
-        ser.write(b"GO\n")
+        print("[!] Local model load failed:", e)
+        local_model = None
+    return local_model
+
+# 서버 판정 (스테이션 설정의 url/budget, 라인별 추론 스레드 풀), 등급 판정은 이것만 사용
+def infer_server(image_bytes, payload, trace):
+    return post_image_to_server(image_bytes, trace.config["url"], budget=trace.budget(trace.config["budget"]),
+                                line=trace.line)
+
+# 결함 판정: 서버 + 로컬 모델 (fallback: 동시에 돌려두고 서버가 없으면 사용, first_pass: 확실하면 서버 생략)
+def infer_defect(image_bytes, payload, trace):
+    model = local_model
+    if model is None:
+        return infer_server(image_bytes, payload, trace)
+    image = payload.image if isinstance(payload, Frame) else payload
+
+    if LOCAL_MODEL_MODE == "first_pass":
+        # 로컬 추론은 항상 모델 스레드 풀에서 (cv2.dnn 네트워크를 여러 작업 스레드가 동시에 쓰지 않도록)
+        try:
+            local = model.submit(image).result(timeout=LOCAL_MODEL_TIMEOUT)
+        except Exception as e:
+            print("[!] Local inference failed:", repr(e))
+            local = None
+        if local is not None and local["score"] >= LOCAL_MODEL_CONFIDENT:
+            trace.note("verdict", "local")
+            metrics.inc("local_verdicts_total", station=trace.label, reason="confident")
+            return local
+        remote = infer_server(image_bytes, payload, trace)
+        if remote is not None or local is None:
+            return remote
+        trace.note("verdict", "local")
+        metrics.inc("local_verdicts_total", station=trace.label, reason="server_missed")
+        return local
 
-# SNAP2 처리 (등급 판별)
-def handle_snap2(ser):
+    future = model.submit(image)
+    remote = infer_server(image_bytes, payload, trace)
+    if remote is not None:
+        return remote
     try:
-        frame = capture_image(CAM_IR2)
-        image_bytes = encode_jpeg(frame)
-        if not image_bytes:
-            raise ValueError("JPEG encoding failed")
+        local = future.result(timeout=LOCAL_MODEL_TIMEOUT)
+    except Exception as e:
+        print("[!] Local inference failed:", e)
+        return None
+    trace.note("verdict", "local")
+    metrics.inc("local_verdicts_total", station=trace.label, reason="server_missed")
+    return local
+
+# ─────────────────────────────
+# 파이프라인 컨베이어 모드
+# 촬영이 끝나면 바로 PIPELINE_RELEASE 로 벨트를 재개하고, 부품별(트리거 순번) 판정을 모아 두었다가
+# 부품이 분류기에 도착하는 시각에 분류 명령(SERVO ...)을 보냄. 그때까지 판정이 없으면 기본 처리(통과)
+
+# 이동 시간/분류 명령은 스테이션 설정의 travel/sort 가 있으면 우선 사용
+class Part:
+    def __init__(self, trace, send):
+        self.station = trace.label
+        self.trace = trace
+        self.send = send
+        self.due = trace.started + trace.config.get("travel", PIPELINE_TRAVEL.get(trace.station, 0.0))
+        self.sort = trace.config.get("sort", PIPELINE_SORT.get(trace.station, {}))
+        self.label = None
+        self.decided = None     # 판정 도착 시각
+        self.sent = False
+
+# 핸들러의 판정 응답을 받아 분류 시점까지 보관
+# 응답 바이트가 아니라 trace.verdict 로 판정을 구분 (SNAP1 의 GO 는 정상일 수도, 판정 없음일 수도 있음)
+class DeferredReply:
+    def __init__(self, pipeline, part):
+        self.pipeline = pipeline
+        self.part = part
+
+    def write(self, data):
+        self.pipeline.decide(self.part, self.part.trace.verdict)
+        return len(data)
+
+class Pipeline:
+    def __init__(self):
+        self.parts = []             # (전송 시각, 순서, Part) 힙
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.in_flight = collections.Counter()
+        self.thread = None
 
-        ts = int(time.time())
-        filename = f"snap2_{ts}.jpg"
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="pipeline", daemon=True)
+            self.thread.start()
+        return self
 
-        upload_to_gcs(image_bytes, filename, GCS_FOLDER_SNAP2)
+    # 촬영 완료: 벨트 재개 응답 후, 이후 판정 응답은 분류 시점까지 보류하는 채널 반환
+    # call 이 있으면 분류 명령 전송을 그 함수로 넘김 (asyncio 이벤트 루프에서 쓰기 위함)
+    def release(self, ser, trace, call=None):
+        ser.write(PIPELINE_RELEASE)
+        send = ser.write if call is None else (lambda data: call(ser.write, data))
+        part = Part(trace, send)
+        trace.deadline = part.due
+        with self.cond:
+            heapq.heappush(self.parts, (part.due, next(self.order), part))
+            self.in_flight[part.station] += 1
+            self.cond.notify()
+        return DeferredReply(self, part)
 
-        result = post_image_to_server(image_bytes, URL_SNAP2)
-        grade = result.get("label") if result else None
+    def decide(self, part, label):
+        with self.cond:
+            if part.sent:
+                late = time.monotonic() - part.due
+                metrics.inc("pipeline_parts_total", station=part.station, result="late")
+                print(f"[!] {part.station} #{part.trace.id} verdict {label} arrived {late * 1000:.0f}ms after the part passed")
+                return
+            part.label = label
+            part.decided = time.monotonic()
 
-        if grade:
-            ser.write(f"RESULT:{grade}\n".encode())
-            print(f"[SNAP2] Grade → sent: RESULT:{grade}")
+    def _loop(self):
+        while True:
+            with self.cond:
+                while not self.parts or self.parts[0][0] > time.monotonic():
+                    self.cond.wait(self.parts[0][0] - time.monotonic() if self.parts else None)
+                _, _, part = heapq.heappop(self.parts)
+                part.sent = True
+                self.in_flight[part.station] -= 1
+                label, decided = part.label, part.decided
+            self._sort(part, label, decided)
+
+    # 판정 없음(분류 시점까지 응답 없음, 품질 검사 불합격, 지연 초과, 오류)은 "*" 가 아니라
+    # "fallback" 명령을 쓰고, 없으면 통과 (판정 없는 부품을 특정 등급 레인으로 보내지 않도록)
+    def _sort(self, part, label, decided):
+        table = part.sort
+        if decided is None:
+            metrics.inc("pipeline_parts_total", station=part.station, result="missed")
+            record_fallback(part.station)
+        elif label is None:
+            metrics.inc("pipeline_parts_total", station=part.station, result="fallback")
         else:
-            ser.write(b"GO\n")
-            print("[SNAP2] Grade missing → sent: GO")
+            metrics.inc("pipeline_parts_total", station=part.station, result="on_time")
+            metrics.observe("pipeline_slack_seconds", part.due - decided, station=part.station)
+        command = table.get(label, table.get("*")) if label is not None else table.get("fallback")
+        if command:
+            try:
+                part.send(f"{command}\n".encode())
+            except Exception as e:
+                print(f"[!] {part.station} #{part.trace.id} sort command failed:", e)
+        print(f"[{part.station} #{part.trace.id}] Sorted: {label or 'no verdict'} → {command or 'pass'}")
+
+    def stats(self):
+        with self.cond:
+            return dict(self.in_flight)
+
+pipeline = Pipeline()
+
+# ─────────────────────────────
+# 라인/스테이션 설정
+# 라인: 시리얼 포트 + 트리거 키워드별 스테이션, 스테이션: 카메라/서버/업로드 폴더/응답 매핑
+# replies: 판정 라벨별 응답, "*" = 그 외 라벨, "fallback" = 판정 없음/실패 ({label} 은 판정 라벨로 치환)
+
+def default_lines():
+    return [{
+        "name": DEFAULT_LINE,
+        "port": PORT,
+        "stations": {
+            SNAP1_KEYWORD: {
+                "handler": "defect", "camera": CAM_IR1, "burst": 1, "profile": "snap1",
+                "url": URL_SNAP1, "health_url": HEALTH_URL_SNAP1, "budget": SNAP1_BUDGET,
+                "folder": GCS_FOLDER_SNAP1,
+                "replies": {"X": "X", "*": "GO", "fallback": "GO"},
+            },
+            SNAP2_KEYWORD: {
+                "handler": "grade", "camera": CAM_IR2, "burst": BURST_SNAP2, "profile": "snap2",
+                "url": URL_SNAP2, "health_url": HEALTH_URL_SNAP2, "budget": SNAP2_BUDGET,
+                "folder": GCS_FOLDER_SNAP2,
+                "replies": {"*": "RESULT:{label}", "fallback": "GO"},
+            },
+        },
+    }]
+
+def configured_lines():
+    return LINES or default_lines()
+
+# 라인 설정이 없는 호출(단독 핸들러 실행 등)은 첫 라인의 스테이션 설정 사용
+def station_config(station):
+    return configured_lines()[0]["stations"].get(station, {})
+
+# 판정 라벨 → 아두이노 응답 바이트
+def reply_for(config, label):
+    replies = config["replies"]
+    if label is None:
+        text = replies["fallback"]
+    else:
+        text = replies.get(label, replies.get("*", replies["fallback"]))
+    return f"{text.format(label=label)}\n".encode()
+
+# ─────────────────────────────
+# 스테이션 처리 흐름 (동기 run_station 과 cam_async 의 AsyncController.run_station 이 같은 단계를 사용)
+# 촬영 → (파이프라인) 벨트 재개 → 전처리 → 재트리거 판정 재사용 확인 → 보관 업로드 → 인코딩/추론 → 응답
+
+# 판정 라벨 → 결과(outcome) 이름 (메트릭/로그용), "*" = 그 외 라벨
+STATION_OUTCOMES = {
+    "defect": {"X": "defect", "*": "normal"},
+    "grade": {"*": "graded"},
+}
+
+# 판정 캐시 키: 기본 라인은 프로필 이름 그대로 (snap1, snap2), 다른 라인은 "라인/프로필"
+def cache_key(trace):
+    profile = trace.config["profile"]
+    return profile if trace.line == DEFAULT_LINE else f"{trace.line}/{profile}"
+
+# 파이프라인 모드: 벨트 재개 후 판정 응답을 분류 시점까지 보류하는 채널 반환 (이전 판정은 재사용 안 함)
+def release_part(ser, trace, call=None):
+    if not PIPELINE_MODE:
+        return ser
+    verdict_cache.release(cache_key(trace))
+    return pipeline.release(ser, trace, call)
+
+# 정지-재개 모드: 응답(GO/X/등급)을 보내면 벨트가 다시 움직이므로 벨트 재개로 기록
+def reply_sent(trace):
+    if not PIPELINE_MODE:
+        verdict_cache.release(cache_key(trace))
+
+# 품질 검사 불합격: 기본 응답
+def reply_rejected(ser, trace):
+    fallback = reply_for(trace.config, None)
+    record_fallback(trace.label)
+    ser.write(fallback)
+    reply_sent(trace)
+    print(f"[{trace.label} #{trace.id}] Frame failed quality gate → sent: {fallback.decode().strip()}")
+    return "rejected"
+
+# 같은 부품의 재트리거면 직전 판정, 아니면 None
+def cached_verdict(trace, key):
+    result = verdict_cache.get(cache_key(trace), key, trace.started, trace.seq)
+    if result is not None:
+        trace.note("verdict", "cached")
+        print(f"[{trace.label} #{trace.id}] Re-trigger of the same part (distance={result['cache_distance']}), reusing verdict")
+    return result
+
+# 판정 저장(서버 판정만) + 응답 전송, 결과 이름 반환
+def reply_verdict(ser, trace, key, result, cached=False):
+    label = (result.get("label") if result else None) or None
+    if label is not None and not cached and result.get("source") != "local":
+        verdict_cache.put(cache_key(trace), key, result, trace.started, trace.seq)
+    with trace.span("reply"):
+        trace.verdict = label
+        reply = reply_for(trace.config, label)
+        ser.write(reply)
+    reply_sent(trace)
+    sent = reply.decode().strip()
+    if label is None:
+        record_fallback(trace.label)
+        print(f"[{trace.label} #{trace.id}] No verdict within budget → sent: {sent}")
+        return "fallback"
+    outcomes = STATION_OUTCOMES[trace.config["handler"]]
+    outcome = outcomes.get(label, outcomes["*"])
+    focus = trace.notes.get("focus")
+    print(f"[{trace.label} #{trace.id}] {outcome.capitalize()} → sent: {sent}" + (f" (focus={focus})" if focus is not None else ""))
+    return outcome
+
+# 처리 중 오류: 기본 응답
+def reply_error(ser, trace, error):
+    print(f"[!] {trace.label} #{trace.id} error:", error)
+    trace.verdict = None
+    record_fallback(trace.label)
+    ser.write(reply_for(trace.config, None))
+    reply_sent(trace)
+    return "error"
+
+# 스테이션 1건 처리, infer: (추론용 JPEG, 추론 입력, trace) → 판정 dict 또는 None
+def run_station(ser, trace, infer):
+    st = trace.config
+    outcome = "fallback"
+    released = False
+    try:
+        frame = capture_for_station(st["camera"], trace, st.get("burst", 1))
+        ser = release_part(ser, trace)
+        released = True
+        if frame is None:
+            outcome = reply_rejected(ser, trace)
+            return
+        with trace.span("preprocess"):
+            payload = prepare_inference_image(frame, st["profile"])
+            key = perceptual_hash(payload)
+        result = cached_verdict(trace, key)
+        cached = result is not None
+        if not cached:
+            # 재트리거(캐시 적중)는 같은 부품이므로 다시 업로드하지 않음
+            with trace.span("upload"):
+                archive_frame(frame, archive_name(st["profile"], trace), st["folder"], trace.line)
+            with trace.span("encode"):
+                image_bytes = encode_jpeg(payload, st["profile"])
+            if not image_bytes:
+                raise ValueError("JPEG encoding failed")
+            with trace.span("inference"):
+                result = infer(image_bytes, payload, trace)
+        outcome = reply_verdict(ser, trace, key, result, cached)
     except Exception as e:
-        print("[!] SNAP2 error:", e)
-        ser.write(b"GO\n")
+        # 촬영 중 오류도 파이프라인 모드면 벨트 재개 + 부품 등록 (판정 없음 → fallback 분류)
+        if not released:
+            ser = release_part(ser, trace)
+        outcome = reply_error(ser, trace, e)
+    finally:
+        trace.finish(outcome)
+
+# 결함 검사 스테이션 (SNAP1)
+def handle_snap1(ser, trace=None):
+    run_station(ser, trace or Trace(SNAP1_KEYWORD), infer_defect)
+
+# 등급 판별 스테이션 (SNAP2)
+def handle_snap2(ser, trace=None):
+    run_station(ser, trace or Trace(SNAP2_KEYWORD), infer_server)
+
+# 스테이션 설정의 handler 이름 → 처리 함수
+STATION_KINDS = {
+    "defect": handle_snap1,
+    "grade": handle_snap2,
+}
 
 # ─────────────────────────────
 # 헬스체크 기능
 
-# 카메라 정상 작동 여부 확인
+# 카메라 정상 작동 여부 확인 (캡처 스레드 기록 기반, 카메라 I/O 없음)
 def check_camera(index):
-    try:
-        frame = capture_image(index)
-        return "ok" if frame is not None else "fail"
-    except Exception:
-        return "fail"
+    cam = cameras.get(index)
+    return cam.health()["status"] if cam else "fail"
 
 # 서버 응답 상태 확인
 def check_server_health(url):
     try:
-        resp = requests.get(url, timeout=3)
+        resp = inference.get(url, timeout=HEALTH_TIMEOUT)
         return "ok" if resp.status_code == 200 else "fail"
     except Exception:
         return "fail"
 
-# 헬스 상태 프론트엔드 서버로 전송
-def report_health_to_frontend():
-    status = {
-        "camera1": check_camera(CAM_IR1),
-        "camera2": check_camera(CAM_IR2),
-        "defect_server": check_server_health("http://34.64.178.127:8000/health"),
-        "classify_server": check_server_health("http://34.64.178.127:8100/health"),
+health_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="health")
+
+# 업로드/추론 관련 처리 통계 (헬스 상태에 함께 전송)
+def health_stats():
+    with fallback_lock:
+        fallbacks = dict(fallback_counts)
+    return {
+        "cameras": {index: cam.health() for index, cam in list(cameras.items())},
+        "upload_queue": uploader.stats(),
+        "gcs": gcs.stats(),
+        "fallbacks": fallbacks,
+        "breakers": {url: b.state for url, b in list(breakers.items())},
+        "verdict_cache": verdict_cache.stats(),
+        "serial": {name: link.stats() for name, link in list(serial_links.items())},
+        "pipeline": pipeline.stats() if PIPELINE_MODE else None,
+        "metrics": metrics.summary(),
     }
+
+# 헬스 상태 프론트엔드 서버로 전송
+# 헬스 상태 키: 기본 라인은 기존 키(camera1, defect_server ...), 다른 라인은 "라인/" 접두어
+HEALTH_SERVER_KEYS = {"defect": "defect_server", "grade": "classify_server"}
+
+def health_targets(lines):
+    cams, servers = {}, {}
+    for line in lines:
+        prefix = "" if line["name"] == DEFAULT_LINE else f"{line['name']}/"
+        for i, st in enumerate(line["stations"].values(), 1):
+            cams[f"{prefix}camera{i}"] = st["camera"]
+            servers[f"{prefix}{HEALTH_SERVER_KEYS.get(st['handler'], st['handler'])}"] = st["health_url"]
+    return cams, servers
+
+# 카메라 상태 + 서버 점검 결과 + 처리 통계
+def health_status(cams, server_results):
+    status = {key: check_camera(index) for key, index in cams.items()}
+    status.update(server_results)
     status["overall"] = "ok" if all(v == "ok" for v in status.values()) else "fail"
+    status.update(health_stats())
+    return status
+
+def report_health_to_frontend(lines=None):
+    # 서버 점검은 동시에 수행 (검사 스레드와 카메라는 건드리지 않음)
+    cams, servers = health_targets(lines or configured_lines())
+    futures = {key: health_pool.submit(check_server_health, url) for key, url in servers.items()}
+    status = health_status(cams, {key: f.result() for key, f in futures.items()})
 
     try:
-        resp = requests.post(FRONT_HEALTHCHECK_URL, json=status, timeout=5)
+        resp = inference.session.post(FRONT_HEALTHCHECK_URL, json=status, timeout=HEALTH_TIMEOUT)
         print("[HealthCheck] Sent:", status, "| Response:", resp.status_code)
     except Exception as e:
         print("[!] HealthCheck send failed:", e)
 
 # 1분 주기로 헬스체크 반복 실행
-def start_healthcheck_loop():
+def start_healthcheck_loop(lines=None):
     def loop():
         while True:
-            report_health_to_frontend()
-            time.sleep(60)
+            report_health_to_frontend(lines)
+            time.sleep(HEALTH_INTERVAL)
     threading.Thread(target=loop, daemon=True).start()
 
 # ─────────────────────────────
-# 메인 실행 루프
-def main():
-    ser = open_serial()
-    report_health_to_frontend()
-    start_healthcheck_loop()
+# 이벤트 디스패처 (스테이션별 독립 작업 스레드)
+
+# 여러 작업 스레드가 동시에 응답을 쓰지 않도록 쓰기를 직렬화한 시리얼 포트
+class LockedSerial:
+    def __init__(self, ser, codec=None):
+        self.ser = ser
+        self.codec = codec or make_codec()
+        self.lock = threading.Lock()
+
+    # seq 가 있으면 해당 트리거에 대한 응답으로 프레임 구성 (텍스트 모드는 그대로 전송)
+    def write(self, data, seq=None):
+        with self.lock:
+            return self.ser.write(self.codec.encode(data, seq))
+
+    # 첫 바이트가 올 때까지만 대기하고, 이미 도착해 있는 바이트는 in_waiting 만큼 한 번에 읽음
+    def _read(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if data:
+            waiting = self.ser.in_waiting
+            if waiting:
+                data += self.ser.read(waiting)
+        return data
+
+    # 데이터가 없어도 미완성 프레임이 남아 있으면 코덱에 넘겨 대기 시간 초과를 처리
+    def _feed(self, data):
+        return self.codec.feed(data) if data or self.codec.buffer else []
+
+    def read_messages(self):
+        return self._feed(self._read())
+
+    def replier(self, seq):
+        return Replier(self, seq)
+
+    def close(self):
+        self.ser.close()
+
+# 트리거 하나에 대한 응답 채널 (핸들러는 ser.write(b"GO\n") 그대로 사용)
+class Replier:
+    def __init__(self, ser, seq):
+        self.ser = ser
+        self.seq = seq
 
+    def write(self, data):
+        return self.ser.write(data, self.seq)
+
+# 끊김을 감지하면 같은 프로세스 안에서 포트를 다시 열고 밀린 응답을 재전송
+# 끊긴 동안의 write 는 예외 대신 재전송 대기열에 쌓임 (핸들러/카메라/업로드 상태는 그대로 유지)
+class SupervisedSerial(LockedSerial):
+    def __init__(self, ser, codec=None, port=None):
+        super().__init__(ser, codec)
+        self.port = port or PORT
+        self.replies = ReplyLog()
+        self.connected = True
+        self.reconnects = 0
+        self.replay_at = None       # 재연결 후 재전송 예정 시각 (아두이노 부팅 대기)
+
+    def write(self, data, seq=None):
+        with self.lock:
+            if not self.connected:
+                self.replies.failed(data, seq)
+                return 0
+            try:
+                n = self.ser.write(self.codec.encode(data, seq))
+            except (SerialException, OSError) as e:
+                print("[!] Serial write failed, reply queued:", e)
+                self.replies.failed(data, seq)
+                self._mark_lost()
+                return 0
+        if self.codec.framed:
+            self.replies.sent(data, seq)
+        return n
+
+    def read_messages(self):
+        if not self.connected:
+            self._reconnect()
+            return []
+        try:
+            data = self._read()
+        except (SerialException, OSError) as e:
+            print("[!] Serial connection lost:", e)
+            with self.lock:
+                self._mark_lost()
+            return []
+        # 재연결 직후: 아두이노가 무엇이든 보내기 시작하거나(코덱이 버리는 상태 출력 포함) 부팅 대기가 끝나면 재전송
+        if self.replay_at is not None and (data or time.monotonic() >= self.replay_at):
+            self.replay_at = None
+            self._replay()
+        messages = self._feed(data)
+        result = []
+        for message in messages:
+            seq = parse_ack(message)
+            if seq is None:
+                result.append(message)
+            else:
+                self.replies.ack(seq)
+        return result
+
+    # lock 을 잡은 상태에서 호출
+    def _mark_lost(self):
+        if not self.connected:
+            return
+        self.connected = False
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+
+    def _reconnect(self):
+        t0 = time.monotonic()
+        wait_for_port(self.port)
+        try:
+            ser = connect_serial(self.port)
+        except (SerialException, OSError) as e:
+            print("[!] Serial reopen failed:", e)
+            time.sleep(SERIAL_RECONNECT_POLL)
+            return
+        with self.lock:
+            self.ser = ser
+            self.codec.reset()
+            self.connected = True
+        self.reconnects += 1
+        self.replay_at = time.monotonic() + SERIAL_BOOT_WAIT
+        elapsed = time.monotonic() - t0
+        metrics.inc("serial_reconnects_total")
+        metrics.observe("serial_reconnect_seconds", elapsed)
+        print(f"[*] Serial reconnected in {elapsed * 1000:.0f}ms, {len(self.replies)} replies pending")
+
+    def _replay(self):
+        items = self.replies.take_replay()
+        for data, seq in items:
+            self.write(data, seq)
+        if items:
+            metrics.inc("serial_replies_total", len(items), result="replayed")
+            print(f"[*] Replayed {len(items)} replies after reconnect")
+
+    def stats(self):
+        return {"connected": self.connected, "reconnects": self.reconnects, "pending_replies": len(self.replies)}
+
+# 시리얼 트리거를 스테이션별 대기열로 나눠 병렬 처리
+class Dispatcher:
+    def __init__(self, ser, handlers, workers=1, line=None, configs=None):
+        self.ser = ser
+        self.handlers = handlers
+        self.workers = workers      # 스테이션별 작업 스레드 수 (파이프라인 모드에서는 여러 부품 동시 처리)
+        self.line = line            # 라인 이름과 스테이션 설정 (Trace 에 전달)
+        self.configs = configs or {}
+        self.queues = {name: queue.Queue() for name in handlers}
+        self.threads = []
+
+    def start(self):
+        for name, handler in self.handlers.items():
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, args=(name, handler),
+                                     name=f"station-{self.line or DEFAULT_LINE}-{name}-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+        return self
+
+    def stop(self):
+        for q in self.queues.values():
+            for _ in range(self.workers):
+                q.put(None)
+        for t in self.threads:
+            t.join(timeout=2)
+
+    # 트리거 등록 (해당 스테이션이 아니면 무시), 대기 시간은 메시지 수신 시각부터 계산
+    def dispatch(self, message):
+        q = self.queues.get(message.text)
+        if q is None:
+            return False
+        q.put((message.arrived, message.seq))
+        return True
+
+    def _worker(self, name, handler):
+        q = self.queues[name]
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            arrived, seq = item
+            try:
+                handler(self.ser.replier(seq), Trace(name, started=arrived, seq=seq,
+                                                     line=self.line, config=self.configs.get(name)))
+            except Exception as e:
+                print(f"[!] {name} worker error:", e)
+
+serial_links = {}       # 라인 이름 → 실행 중인 시리얼 연결 (헬스 상태 보고용)
+
+# ─────────────────────────────
+# 라인 실행 (라인마다 시리얼 연결, 디스패처, 스테이션 작업 스레드를 따로 가짐)
+
+class Line:
+    def __init__(self, config):
+        self.config = config
+        self.name = config["name"]
+        self.stations = config["stations"]
+        self.running = False
+        self.ser = None
+
+    # 블로킹: 시리얼 연결 → 디스패처 시작 → 트리거 읽기 루프
+    # 펌웨어 상태 출력은 코덱에서 걸러지므로 읽기 루프에는 트리거만 도착
+    # 포트가 끊기면 read_messages 안에서 재연결하므로 루프는 계속 진행
+    def run(self):
+        self.running = True
+        get_pools(self.name)
+        for st in self.stations.values():
+            get_camera(st["camera"])
+        port = self.config.get("port", PORT)
+        self.ser = SupervisedSerial(open_serial(port), make_codec(commands=[*self.stations, SERIAL_ACK]), port=port)
+        serial_links[self.name] = self.ser
+        handlers = {keyword: STATION_KINDS[st["handler"]] for keyword, st in self.stations.items()}
+        dispatcher = Dispatcher(self.ser, handlers, PIPELINE_DEPTH if PIPELINE_MODE else 1,
+                                line=self.name, configs=self.stations).start()
+        prefix = "[ARDUINO]" if self.name == DEFAULT_LINE else f"[ARDUINO {self.name}]"
+        try:
+            while self.running:
+                for message in self.ser.read_messages():
+                    print(prefix, message.text if message.seq is None else f"{message.text} (seq={message.seq})")
+                    dispatcher.dispatch(message)
+        finally:
+            dispatcher.stop()
+            self.ser.close()
+
+    def stop(self):
+        self.running = False
+
+# 라인마다 스레드 하나로 실행하고, 예외로 멈춘 라인은 LINE_RESTART_DELAY 후 다시 시작
+def supervise_threads(lines):
+    def run(line):
+        try:
+            line.run()
+        except Exception as e:
+            print(f"[!] Line {line.name} stopped:", e)
+
+    workers = {}
     try:
         while True:
-            line = ser.readline().decode(errors='ignore').strip()
-            if not line:
-                continue
-            print("[ARDUINO]", line)
+            for config in lines:
+                name = config["name"]
+                entry = workers.get(name)
+                if entry is not None and entry[1].is_alive():
+                    continue
+                if entry is not None:
+                    time.sleep(LINE_RESTART_DELAY)
+                    print(f"[*] Restarting line {name}")
+                line = Line(config)
+                thread = threading.Thread(target=run, args=(line,), name=f"line-{name}", daemon=True)
+                thread.start()
+                workers[name] = (line, thread)
+            time.sleep(1)
+    finally:
+        for line, thread in workers.values():
+            line.stop()
+        for line, thread in workers.values():
+            thread.join(timeout=2)
 
-            if line == SNAP1_KEYWORD:
-                handle_snap1(ser)
-            elif line == SNAP2_KEYWORD:
-                handle_snap2(ser)
+# 공용 서비스(업로드, 추론 연결, 메트릭, 헬스체크) 시작 후 라인 실행
+def serve(lines, metrics_addr=None, spool_dir=None):
+    uploader.spool = UploadSpool(spool_dir or SPOOL_DIR).start()
+    uploader.start()
+    load_local_model()
+    inference.warm([st["health_url"] for line in lines for st in line["stations"].values()])
+    start_metrics_server(metrics_addr)
+    start_healthcheck_loop(lines)
+    if PIPELINE_MODE:
+        pipeline.start()
+    try:
+        supervise_threads(lines)
+    except KeyboardInterrupt:
+        print("\n[*] Stopped by user")
+    finally:
+        for cam in cameras.values():
+            cam.stop()
+        if uploader.spool is not None:
+            uploader.spool.close()
+
+# 프로세스 모드의 라인 하나: 메트릭 포트와 업로드 보관소를 라인별로 분리
+def run_line_process(config, index):
+    addr = None if METRICS_ADDR is None else (METRICS_ADDR[0], METRICS_ADDR[1] + index)
+    serve([config], addr, os.path.join(SPOOL_DIR, config["name"]))
 
+# 라인마다 프로세스 하나 (GIL 분리), 종료된 프로세스는 다시 시작
+def supervise_processes(lines):
+    procs = {}
+    try:
+        while True:
+            for index, config in enumerate(lines):
+                proc = procs.get(index)
+                if proc is not None and proc.is_alive():
+                    continue
+                if proc is not None:
+                    print(f"[!] Line {config['name']} process exited ({proc.exitcode}), restarting")
+                    time.sleep(LINE_RESTART_DELAY)
+                proc = multiprocessing.Process(target=run_line_process, args=(config, index),
+                                               name=f"line-{config['name']}", daemon=True)
+                proc.start()
+                procs[index] = proc
+            time.sleep(1)
     except KeyboardInterrupt:
         print("\n[*] Stopped by user")
-    except SerialException as e:
-        print("[!] Serial error:", e)
     finally:
-        ser.close()
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.join(timeout=5)
+
+# ─────────────────────────────
+# 메인 실행
+def main():
+    lines = configured_lines()
+    if LINE_PROCESSES and len(lines) > 1:
+        supervise_processes(lines)
+    else:
+        serve(lines, METRICS_ADDR, SPOOL_DIR)
 
 # ─────────────────────────────
 if __name__ == "__main__":
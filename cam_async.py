@@ -0,0 +1,468 @@
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cam
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# ─────────────────────────────
+# asyncio 기반 검사 컨트롤러
+# 설정값과 동기 함수(capture_image, encode_jpeg, upload_to_gcs ...)는 cam.py 것을 그대로 사용
+CAMERA_WORKERS = 2                  # 카메라 읽기/JPEG 인코딩 스레드 수
+
+# ─────────────────────────────
+# 비동기 시리얼 리더 (이벤트 루프에 fd 를 등록해 읽기)
+# 끊기면 스레드 풀에서 포트를 다시 열고 밀린 응답을 재전송 (cam.SupervisedSerial 과 같은 규칙)
+class AsyncSerial:
+    def __init__(self, ser, codec=None, port=None):
+        self.ser = ser
+        self.ser.timeout = 0
+        self.codec = codec or cam.make_codec()
+        self.port = port or cam.PORT
+        self.messages = asyncio.Queue()
+        self.replies = cam.ReplyLog()
+        self.connected = True
+        self.reconnects = 0
+        self.replay_handle = None
+        self.reconnect_task = None
+        self.loop = None
+
+    def start(self, loop):
+        self.loop = loop
+        loop.add_reader(self.ser.fileno(), self._on_readable)
+        return self
+
+    # 진행 중인 재연결/재전송 예약도 함께 취소 (라인 재시작 시 이전 링크가 포트를 다시 열지 않도록)
+    async def stop(self):
+        if self.replay_handle is not None:
+            self.replay_handle.cancel()
+            self.replay_handle = None
+        task, self.reconnect_task = self.reconnect_task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        if self.connected:
+            self.loop.remove_reader(self.ser.fileno())
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (cam.SerialException, OSError) as e:
+            print("[!] Serial connection lost:", e)
+            self._mark_lost()
+            return
+        # 코덱이 버리는 상태 출력이라도 바이트가 오면 아두이노가 살아난 것이므로 바로 재전송
+        if data and self.replay_handle is not None:
+            self.replay_handle.cancel()
+            self._replay()
+        messages = self.codec.feed(data)
+        for message in messages:
+            seq = cam.parse_ack(message)
+            if seq is None:
+                self.messages.put_nowait(message)
+            else:
+                self.replies.ack(seq)
+
+    def _mark_lost(self):
+        if not self.connected:
+            return
+        self.connected = False
+        self.loop.remove_reader(self.ser.fileno())
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        self.reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        t0 = time.monotonic()
+        while True:
+            await self.loop.run_in_executor(None, cam.wait_for_port, self.port)
+            try:
+                ser = await self.loop.run_in_executor(None, cam.connect_serial, self.port)
+                break
+            except (cam.SerialException, OSError) as e:
+                print("[!] Serial reopen failed:", e)
+                await asyncio.sleep(cam.SERIAL_RECONNECT_POLL)
+        ser.timeout = 0
+        self.ser = ser
+        self.codec.reset()
+        self.connected = True
+        self.loop.add_reader(ser.fileno(), self._on_readable)
+        self.reconnects += 1
+        elapsed = time.monotonic() - t0
+        cam.metrics.inc("serial_reconnects_total")
+        cam.metrics.observe("serial_reconnect_seconds", elapsed)
+        print(f"[*] Serial reconnected in {elapsed * 1000:.0f}ms, {len(self.replies)} replies pending")
+        # 아두이노가 데이터를 보내기 시작하거나 부팅 대기가 끝나면 재전송
+        self.replay_handle = self.loop.call_later(cam.SERIAL_BOOT_WAIT, self._replay)
+
+    def _replay(self):
+        self.replay_handle = None
+        items = self.replies.take_replay()
+        for data, seq in items:
+            self.write(data, seq)
+        if items:
+            cam.metrics.inc("serial_replies_total", len(items), result="replayed")
+            print(f"[*] Replayed {len(items)} replies after reconnect")
+
+    async def read_message(self):
+        return await self.messages.get()
+
+    # 이벤트 루프 스레드에서만 호출되므로 별도 잠금 불필요
+    def write(self, data, seq=None):
+        if not self.connected:
+            self.replies.failed(data, seq)
+            return 0
+        try:
+            n = self.ser.write(self.codec.encode(data, seq))
+        except (cam.SerialException, OSError) as e:
+            print("[!] Serial write failed, reply queued:", e)
+            self.replies.failed(data, seq)
+            self._mark_lost()
+            return 0
+        if self.codec.framed:
+            self.replies.sent(data, seq)
+        return n
+
+    def replier(self, seq):
+        return cam.Replier(self, seq)
+
+    def stats(self):
+        return {"connected": self.connected, "reconnects": self.reconnects, "pending_replies": len(self.replies)}
+
+# ─────────────────────────────
+# 비동기 추론 서버 클라이언트 (keep-alive 연결 풀 + 예산 + 헤지 + 서킷 브레이커)
+class AsyncInferenceClient:
+    def __init__(self, pool_size=cam.INFER_POOL_SIZE):
+        connector = aiohttp.TCPConnector(limit_per_host=pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        await self.session.close()
+
+    async def warm(self, urls):
+        await asyncio.gather(*(self.check(url) for url in urls))
+
+    async def check(self, url, timeout=cam.HEALTH_TIMEOUT):
+        try:
+            async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                await resp.read()
+                return "ok" if resp.status == 200 else "fail"
+        except Exception:
+            return "fail"
+
+    # (서버 주소, 응답) 반환, 실패하면 응답은 None (차단기 실패 기록은 post_image 에서)
+    async def _request_once(self, url, image_bytes, deadline):
+        try:
+            form = aiohttp.FormData()
+            form.add_field("file", image_bytes, filename="image.jpg", content_type="image/jpeg")
+            timeout = aiohttp.ClientTimeout(total=max(0.05, deadline - time.monotonic()))
+            async with self.session.post(url, data=form, timeout=timeout) as resp:
+                if resp.status == 200:
+                    result = await resp.json(content_type=None)
+                    cam.get_breaker(url).success()
+                    return url, result
+                text = await resp.text()
+                print(f"[!] Server error {resp.status}: {text[:100]}")
+        except Exception as e:
+            print(f"[!] Server request failed: {url}:", repr(e))
+        return url, None
+
+    # cam.post_image_to_server 와 같은 규칙의 비동기 버전
+    async def post_image(self, image_bytes, url, budget=10.0, retries=3):
+        deadline = time.monotonic() + budget
+        order = [url] + cam.INFER_REPLICAS.get(url, [])
+        hedging = len(order) > 1
+        pending = {}   # Task → 서버 주소
+        failed = set()
+        attempt = 0
+
+        def launch():
+            nonlocal attempt
+            while attempt < retries:
+                target = order[attempt % len(order)]
+                attempt += 1
+                if cam.get_breaker(target).allow():
+                    pending[asyncio.ensure_future(self._request_once(target, image_bytes, deadline))] = target
+                    return True
+                print(f"[!] Circuit open, skipped: {target}")
+            return False
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[!] Server deadline exceeded ({budget:.2f}s): {url}")
+                    failed.update(pending.values())
+                    break
+                done, _ = await asyncio.wait(
+                    list(pending), timeout=min(remaining, cam.HEDGE_DELAY) if hedging else remaining,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del pending[task]
+                    target, result = task.result()
+                    if result is not None:
+                        failed.discard(target)
+                        return result
+                    failed.add(target)
+                if done and not pending:
+                    pause = min(cam.INFER_RETRY_DELAY, deadline - time.monotonic())
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                    launch()
+                elif hedging and not done:
+                    launch()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            for target in failed:
+                cam.get_breaker(target).failure()
+
+# ─────────────────────────────
+# 비동기 컨트롤러: 라인 하나의 스테이션별 작업 코루틴 + 백그라운드 업로드 + 헬스체크
+# 라인마다 컨트롤러 하나 (연결 풀/스레드 풀을 라인별로 따로 가짐)
+class AsyncController:
+    def __init__(self, ser, line=None):
+        self.ser = ser
+        self.line = line or cam.configured_lines()[0]
+        self.name = self.line["name"]
+        self.configs = self.line["stations"]
+        self.client = AsyncInferenceClient()
+        self.camera_pool = ThreadPoolExecutor(max_workers=CAMERA_WORKERS, thread_name_prefix=f"acam-{self.name}")
+        self.upload_pool = ThreadPoolExecutor(max_workers=cam.UPLOAD_WORKERS, thread_name_prefix=f"aupload-{self.name}")
+        self.upload_slots = asyncio.Semaphore(cam.UPLOAD_QUEUE_SIZE)
+        kinds = {"defect": self.handle_snap1, "grade": self.handle_snap2}
+        self.stations = {keyword: kinds[st["handler"]] for keyword, st in self.configs.items()}
+        self.queues = {name: asyncio.Queue() for name in self.stations}
+        self.tasks = set()
+
+    # 캡처 (품질 검사 불합격이면 None)
+    async def capture(self, index, trace, burst=1):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.camera_pool, cam.capture_for_station, index, trace, burst)
+
+    # 추론 입력 생성 (스레드 풀에서 처리)
+    async def preprocess(self, frame, trace, station):
+        loop = asyncio.get_running_loop()
+        with trace.span("preprocess"):
+            return await loop.run_in_executor(self.camera_pool, cam.prepare_inference_image, frame, station)
+
+    # 추론용 JPEG (판정 캐시에 없을 때만 인코딩)
+    async def encode(self, payload, trace, station):
+        with trace.span("encode"):
+            image_bytes = await asyncio.wrap_future(cam.encode_async(payload, station, self.name))
+        if not image_bytes:
+            raise ValueError("JPEG encoding failed")
+        return image_bytes
+
+    # 업로드는 기다리지 않음: 전체 프레임을 백그라운드에서 인코딩 후 업로드
+    def archive(self, frame, filename, folder):
+        task = asyncio.ensure_future(self._upload(frame, filename, folder))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _upload(self, frame, filename, folder):
+        image_bytes = await asyncio.wrap_future(cam.encode_async(frame, "archive", self.name))
+        if not image_bytes:
+            return
+        # 동시 업로드 수가 꽉 차면 바로 spool 로 넘김 (파일 기록 + SQLite 커밋은 이벤트 루프 밖에서)
+        loop = asyncio.get_running_loop()
+        if self.upload_slots.locked():
+            await loop.run_in_executor(None, cam.uploader.to_spool, image_bytes, filename, folder)
+            return
+        async with self.upload_slots:
+            ok = await loop.run_in_executor(self.upload_pool, cam.upload_to_gcs, image_bytes, filename, folder)
+            if ok:
+                cam.uploader.uploaded()
+            else:
+                cam.uploader.count("failed")
+                await loop.run_in_executor(self.upload_pool, cam.uploader.to_spool, image_bytes, filename, folder)
+
+    # cam.infer_defect 의 비동기 버전 (로컬 모델은 cam.local_model 의 스레드 풀에서 실행)
+    async def infer_defect(self, image_bytes, payload, trace):
+        model = cam.local_model
+        remote = self.infer_server(image_bytes, payload, trace)
+        if model is None:
+            return await remote
+        image = payload.image if isinstance(payload, cam.Frame) else payload
+        local_future = asyncio.wrap_future(model.submit(image))
+
+        if cam.LOCAL_MODEL_MODE == "first_pass":
+            try:
+                local = await asyncio.wait_for(local_future, cam.LOCAL_MODEL_TIMEOUT)
+            except Exception as e:
+                print("[!] Local inference failed:", repr(e))
+                local = None
+            if local is not None and local["score"] >= cam.LOCAL_MODEL_CONFIDENT:
+                remote.close()
+                trace.note("verdict", "local")
+                cam.metrics.inc("local_verdicts_total", station=trace.label, reason="confident")
+                return local
+            result = await remote
+            if result is not None or local is None:
+                return result
+        else:
+            result = await remote
+            if result is None:
+                try:
+                    local = await asyncio.wait_for(local_future, cam.LOCAL_MODEL_TIMEOUT)
+                except Exception as e:
+                    print("[!] Local inference failed:", repr(e))
+                    return None
+        if result is not None:
+            return result
+        trace.note("verdict", "local")
+        cam.metrics.inc("local_verdicts_total", station=trace.label, reason="server_missed")
+        return local
+
+    # cam.run_station 과 같은 흐름 (응답/캐시/오류 처리 단계는 cam 의 함수를 그대로 사용)
+    async def run_station(self, trace, infer):
+        ser = self.ser.replier(trace.seq)
+        st = trace.config
+        outcome = "fallback"
+        # 파이프라인 모드의 분류 명령은 이벤트 루프에서 전송
+        call = asyncio.get_running_loop().call_soon_threadsafe
+        released = False
+        try:
+            frame = await self.capture(st["camera"], trace, st.get("burst", 1))
+            ser = cam.release_part(ser, trace, call)
+            released = True
+            if frame is None:
+                outcome = cam.reply_rejected(ser, trace)
+                return
+            payload = await self.preprocess(frame, trace, st["profile"])
+            key = cam.perceptual_hash(payload)
+            result = cam.cached_verdict(trace, key)
+            cached = result is not None
+            if not cached:
+                with trace.span("upload"):
+                    self.archive(frame, cam.archive_name(st["profile"], trace), st["folder"])
+                image_bytes = await self.encode(payload, trace, st["profile"])
+                with trace.span("inference"):
+                    result = await infer(image_bytes, payload, trace)
+            outcome = cam.reply_verdict(ser, trace, key, result, cached)
+        except Exception as e:
+            if not released:
+                ser = cam.release_part(ser, trace, call)
+            outcome = cam.reply_error(ser, trace, e)
+        finally:
+            trace.finish(outcome)
+
+    async def infer_server(self, image_bytes, payload, trace):
+        return await self.client.post_image(image_bytes, trace.config["url"], budget=trace.budget(trace.config["budget"]))
+
+    # 결함 검사 스테이션 (SNAP1)
+    async def handle_snap1(self, trace):
+        await self.run_station(trace, self.infer_defect)
+
+    # 등급 판별 스테이션 (SNAP2)
+    async def handle_snap2(self, trace):
+        await self.run_station(trace, self.infer_server)
+
+    async def station_worker(self, name):
+        q = self.queues[name]
+        while True:
+            arrived, seq = await q.get()
+            await self.stations[name](cam.Trace(name, started=arrived, seq=seq,
+                                                line=self.name, config=self.configs[name]))
+
+    # 헬스체크: 서버 점검을 동시에 수행, 카메라는 캡처 스레드 기록으로 판단 (모든 라인을 한 번에 보고)
+    async def health_loop(self, lines):
+        cams, servers = cam.health_targets(lines)
+        while True:
+            results = await asyncio.gather(*(self.client.check(url) for url in servers.values()))
+            status = cam.health_status(cams, dict(zip(servers, results)))
+            try:
+                timeout = aiohttp.ClientTimeout(total=cam.HEALTH_TIMEOUT)
+                async with self.client.session.post(cam.FRONT_HEALTHCHECK_URL, json=status, timeout=timeout) as resp:
+                    print("[HealthCheck] Sent:", status, "| Response:", resp.status)
+            except Exception as e:
+                print("[!] HealthCheck send failed:", repr(e))
+            await asyncio.sleep(cam.HEALTH_INTERVAL)
+
+    # health_lines 가 있으면 이 컨트롤러가 헬스체크 보고도 담당
+    async def run(self, reader, health_lines=None):
+        await self.client.warm([st["health_url"] for st in self.configs.values()])
+        # 파이프라인 모드에서는 스테이션별로 여러 부품을 동시에 처리
+        depth = cam.PIPELINE_DEPTH if cam.PIPELINE_MODE else 1
+        workers = [asyncio.ensure_future(self.station_worker(name)) for name in self.stations for _ in range(depth)]
+        if health_lines:
+            workers.append(asyncio.ensure_future(self.health_loop(health_lines)))
+        prefix = "[ARDUINO]" if self.name == cam.DEFAULT_LINE else f"[ARDUINO {self.name}]"
+        try:
+            while True:
+                message = await reader.read_message()
+                print(prefix, message.text if message.seq is None else f"{message.text} (seq={message.seq})")
+                q = self.queues.get(message.text)
+                if q is not None:
+                    q.put_nowait((message.arrived, message.seq))
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, *self.tasks, return_exceptions=True)
+            await self.client.close()
+            self.camera_pool.shutdown(wait=False)
+            self.upload_pool.shutdown(wait=False)
+
+# ─────────────────────────────
+# 라인 하나: 시리얼 연결 + 컨트롤러, 예외로 멈추면 LINE_RESTART_DELAY 후 다시 시작
+async def run_line(line, health_lines=None):
+    loop = asyncio.get_running_loop()
+    port = line.get("port", cam.PORT)
+    while True:
+        reader = None
+        try:
+            ser = await loop.run_in_executor(None, cam.open_serial, port)
+            commands = [*line["stations"], cam.SERIAL_ACK]
+            reader = AsyncSerial(ser, cam.make_codec(commands=commands), port=port).start(loop)
+            cam.serial_links[line["name"]] = reader
+            await AsyncController(reader, line).run(reader, health_lines)
+        except Exception as e:
+            print(f"[!] Line {line['name']} stopped:", repr(e))
+        finally:
+            if reader is not None:
+                await reader.stop()
+                reader.ser.close()
+        await asyncio.sleep(cam.LINE_RESTART_DELAY)
+        print(f"[*] Restarting line {line['name']}")
+
+async def main_async():
+    lines = cam.configured_lines()
+    for line in lines:
+        for st in line["stations"].values():
+            cam.get_camera(st["camera"])
+    cam.uploader.spool = cam.UploadSpool(cam.SPOOL_DIR).start()
+    cam.start_metrics_server(cam.METRICS_ADDR)
+    cam.load_local_model()
+    if cam.PIPELINE_MODE:
+        cam.pipeline.start()
+
+    try:
+        # 헬스체크 보고는 첫 라인 컨트롤러가 전체 라인을 묶어서 전송
+        await asyncio.gather(*(run_line(line, lines if i == 0 else None) for i, line in enumerate(lines)))
+    finally:
+        for stream in cam.cameras.values():
+            stream.stop()
+        cam.uploader.spool.close()
+
+def main():
+    if not AIOHTTP_AVAILABLE:
+        raise SystemExit("[!] aiohttp is required for the asyncio engine: pip install aiohttp")
+    try:
+        asyncio.run(main_async())
+    except KeyboardInterrupt:
+        print("\n[*] Stopped by user")
+
+# ─────────────────────────────
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fake_gcs import FakeGCS
+
+# ─────────────────────────────
+# GCS 업로드 처리량 측정: 단건 업로드 vs 묶음 병렬 업로드
+# 기본은 로컬 가짜 GCS 서버 사용, --real 지정 시 실제 버킷(service-account.json) 사용
+SAMPLE = Path(__file__).resolve().parent.parent / "test_snaps" / "test_20250730_113500.jpg"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=50, help="업로드할 이미지 수")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--real", action="store_true")
+    args = parser.parse_args()
+
+    gcs_server = None
+    if not args.real:
+        gcs_server = FakeGCS().start()
+        os.environ["STORAGE_EMULATOR_HOST"] = gcs_server.url
+    import cam
+
+    image_bytes = SAMPLE.read_bytes()
+    folder = "bench"
+
+    # 1) 단건 순차 업로드 (클라이언트 재사용)
+    t0 = time.monotonic()
+    for i in range(args.n):
+        cam.gcs.upload(image_bytes, f"single_{i}.jpg", folder)
+    single = time.monotonic() - t0
+    print(f"[*] sequential: {args.n / single:.1f} uploads/s", cam.gcs.stats())
+
+    # 2) 묶음 병렬 업로드 (spool 재전송 경로)
+    tmp = tempfile.mkdtemp(prefix="bench_gcs_")
+    items = []
+    for i in range(args.n):
+        path = os.path.join(tmp, f"batch_{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(image_bytes)
+        items.append((path, f"batch_{i}.jpg", folder))
+    t0 = time.monotonic()
+    results = cam.gcs.upload_files(items, workers=args.workers)
+    batch = time.monotonic() - t0
+    print(f"[*] batch x{args.workers}: {args.n / batch:.1f} uploads/s, ok={sum(results)}/{len(results)}")
+    print("[*] stats:", cam.gcs.stats())
+
+    if gcs_server:
+        gcs_server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# JPEG 인코딩 마이크로 벤치마크 (1280x720): 백엔드/프로필별 프레임당 ms 와 바이트 수
+SAMPLE = Path(__file__).resolve().parent.parent / "test_snaps" / "test_20250730_113500.jpg"
+REPEAT = 50
+
+def bench(image, profile, backend):
+    cam.encode_image(image, profile, backend)   # 워밍업
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        data = cam.encode_image(image, profile, backend)
+    ms = (time.perf_counter() - t0) / REPEAT * 1000
+    return ms, len(data)
+
+def main():
+    image = cv2.resize(cv2.imread(str(SAMPLE)), (1280, 720))
+    backends = ["opencv"] + (["simplejpeg"] if cam.SIMPLEJPEG_AVAILABLE else [])
+    print(f"[*] 1280x720, {REPEAT} runs, simplejpeg={'yes' if cam.SIMPLEJPEG_AVAILABLE else 'no'}")
+    print(f"{'backend':<11} {'profile':<8} {'q':>3} {'sub':>4} {'ms/frame':>9} {'bytes':>8}")
+    for backend in backends:
+        for profile, cfg in cam.JPEG_PROFILES.items():
+            ms, size = bench(image, profile, backend)
+            print(f"{backend:<11} {profile:<8} {cfg['quality']:>3} {cfg['subsampling']:>4} {ms:>9.2f} {size:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fake_gcs import FakeGCS
+
+# ─────────────────────────────
+# 하드웨어 없이 cam.py 전체 파이프라인 성능 측정
+#   가상 시리얼(pty) → SNAP1/SNAP2 트리거 → 가짜 카메라 → 스텁 /defect, /classify 서버 + 가짜 GCS
+#   트리거→응답 지연 백분위와 분당 처리 부품 수를 출력
+# 예) python test/bench_pipeline.py --station both --count 200 --latency 0.08 --jitter 0.3
+SAMPLE = Path(__file__).resolve().parent.parent / "test_snaps" / "test_20250730_113500.jpg"
+
+# ─────────────────────────────
+# 가짜 카메라: 샘플 이미지를 지정한 FPS 로 제공 (cv2.VideoCapture 흉내)
+# 매 프레임 부품 위치를 조금씩 옮겨 품질 검사의 "stale"(멈춘 프레임) 규칙에 걸리지 않게 함
+# mjpeg=True 면 V4L2 MJPG 원본처럼 1xN JPEG 버퍼를 반환
+class FakeCapture:
+    VARIANTS = 16
+
+    def __init__(self, frame, fps=30, mjpeg=False):
+        step = frame.shape[1] // self.VARIANTS
+        self.frames = [np.roll(frame, i * step, axis=1) for i in range(self.VARIANTS)]
+        if mjpeg:
+            self.frames = [cv2.imencode('.jpg', f)[1].reshape(1, -1) for f in self.frames]
+        self.count = 0
+        self.interval = 1 / fps
+        self.next_time = time.monotonic()
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def read(self):
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time + self.interval, time.monotonic())
+        self.count += 1
+        return True, self.frames[self.count % self.VARIANTS].copy()
+
+    def release(self):
+        pass
+
+# ─────────────────────────────
+# 스텁 추론 서버: 로그정규 분포 지연 후 라벨 반환
+class StubServer:
+    def __init__(self, latency, jitter, defect_rate, seed):
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply({"status": "ok"})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub.rng_lock:
+                    delay = latency * stub.rng.lognormvariate(0, jitter) if latency > 0 else 0
+                    defect = stub.rng.random() < defect_rate
+                    grade = stub.rng.choice("ABC")
+                time.sleep(delay)
+                if self.path.startswith("/defect"):
+                    self._reply({"label": "X" if defect else "O"})
+                elif self.path.startswith("/classify"):
+                    self._reply({"label": grade})
+                else:
+                    self._reply({"status": "ok"})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+# ─────────────────────────────
+# 가상 아두이노: pty master 쪽에서 트리거 송신 + 응답 수신
+class VirtualArduino:
+    def __init__(self):
+        self.master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        self.pending = {"SNAP1": [], "SNAP2": []}
+        self.latencies = {"SNAP1": [], "SNAP2": []}
+        self.replies = {"SNAP1": threading.Semaphore(0), "SNAP2": threading.Semaphore(0)}
+        self.lock = threading.Lock()
+        self.unmatched = 0
+        self.sorted = collections.Counter()    # 파이프라인 모드 분류 명령 (SERVO ...)
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def send(self, station):
+        with self.lock:
+            self.pending[station].append(time.monotonic())
+            os.write(self.master, f"{station}\n".encode())
+
+    # test/adu.ino 처럼 주기적으로 상태 줄 출력
+    def chatter(self, interval):
+        line = "감지X: 서보 90도, 모터 정지\n".encode()
+        while True:
+            with self.lock:
+                os.write(self.master, line)
+            time.sleep(interval)
+
+    # 응답 형식으로 스테이션 구분: RESULT:* → SNAP2, X/GO → SNAP1 (SNAP1 이 없으면 SNAP2 의 GO)
+    # 파이프라인 모드의 CAPTURED 는 가장 오래 기다린 트리거에 대응
+    def _match(self, line):
+        if line.startswith("RESULT:"):
+            return "SNAP2"
+        if line in ("X", "GO"):
+            return "SNAP1" if self.pending["SNAP1"] else "SNAP2"
+        if line == "CAPTURED":
+            waiting = [s for s in self.pending if self.pending[s]]
+            return min(waiting, key=lambda s: self.pending[s][0]) if waiting else None
+        return None
+
+    def _read_loop(self):
+        buf = b""
+        while True:
+            buf += os.read(self.master, 4096)
+            *lines, buf = buf.split(b"\n")
+            now = time.monotonic()
+            for raw in lines:
+                line = raw.decode(errors="ignore").strip()
+                if line.startswith("SERVO"):
+                    self.sorted[line] += 1
+                    continue
+                station = self._match(line)
+                with self.lock:
+                    if station is None or not self.pending[station]:
+                        self.unmatched += 1
+                        continue
+                    self.latencies[station].append(now - self.pending[station].pop(0))
+                self.replies[station].release()
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+# ─────────────────────────────
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--station", choices=["SNAP1", "SNAP2", "both"], default="SNAP1")
+    parser.add_argument("--count", type=int, default=100, help="스테이션별 트리거 수")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="스테이션별 초당 트리거 수 (0 이면 응답 후 바로 다음 트리거, 실제 컨베이어 방식)")
+    parser.add_argument("--latency", type=float, default=0.05, help="스텁 서버 지연 중앙값 (초)")
+    parser.add_argument("--jitter", type=float, default=0.25, help="스텁 서버 지연 로그정규 sigma")
+    parser.add_argument("--defect-rate", type=float, default=0.1)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--mjpeg", action="store_true", help="카메라가 MJPG 원본을 주는 경우 흉내")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pipelined", action="store_true",
+                        help="파이프라인 모드: 촬영 직후 CAPTURED 응답 지연 측정, 분류 명령 수 집계")
+    parser.add_argument("--travel", type=float, default=1.5, help="파이프라인 모드 트리거→분류기 시간 (초)")
+    parser.add_argument("--chatter", type=float, default=0, help="펌웨어 상태 줄 출력 간격 (초, 0 이면 없음)")
+    parser.add_argument("--max-fallback", type=float, default=0.0,
+                        help="허용할 기본 응답(GO) 비율, 넘으면 실패 (판정 경로가 아닌 fallback 경로를 측정하지 않도록)")
+    parser.add_argument("--verbose", action="store_true", help="cam.py 로그 출력")
+    args = parser.parse_args()
+
+    gcs = FakeGCS().start()
+    os.environ["STORAGE_EMULATOR_HOST"] = gcs.url
+    import cam
+
+    stub = StubServer(args.latency, args.jitter, args.defect_rate, args.seed)
+    arduino = VirtualArduino()
+    frame = cv2.resize(cv2.imread(str(SAMPLE)), cam.RESOLUTION)
+
+    cam.PORT = arduino.port
+    cam.URL_SNAP1 = f"{stub.url}/defect"
+    cam.URL_SNAP2 = f"{stub.url}/classify"
+    cam.HEALTH_URL_SNAP1 = cam.HEALTH_URL_SNAP2 = f"{stub.url}/health"
+    cam.FRONT_HEALTHCHECK_URL = f"{stub.url}/health"
+    cam.METRICS_ADDR = None
+    cam.SPOOL_DIR = tempfile.mkdtemp(prefix="bench_spool_")
+    cam.open_capture = lambda index: FakeCapture(frame, args.fps, args.mjpeg)
+    if args.pipelined:
+        cam.PIPELINE_MODE = True
+        cam.PIPELINE_TRAVEL = {"SNAP1": args.travel, "SNAP2": args.travel}
+
+    log = io.StringIO()
+    stations = ["SNAP1", "SNAP2"] if args.station == "both" else [args.station]
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else log):
+        threading.Thread(target=cam.main, daemon=True).start()
+        time.sleep(3)   # 시리얼 오픈 대기 (open_serial 의 아두이노 리셋 대기 포함)
+        if args.chatter > 0:
+            threading.Thread(target=arduino.chatter, args=(args.chatter,), daemon=True).start()
+
+        # 응답 후 바로 다음 트리거라도 부품 간격은 최소 (연속 촬영 장수 + 1) 프레임
+        # (실제 벨트에서 두 부품이 같은 프레임에 찍힐 수 없음, 파이프라인 모드는 CAPTURED 가 바로 오므로
+        #  이 간격이 없으면 두 부품이 같은 링버퍼 프레임을 골라 "stale" 로 불합격)
+        def drive(station):
+            min_gap = (cam.station_config(station).get("burst", 1) + 1) / args.fps
+            interval = 1 / args.rate if args.rate > 0 else 0
+            next_time = time.monotonic()
+            last = 0.0
+            for _ in range(args.count):
+                time.sleep(max(0, last + min_gap - time.monotonic()))
+                last = time.monotonic()
+                arduino.send(station)
+                if interval:
+                    next_time += interval
+                    time.sleep(max(0, next_time - time.monotonic()))
+                else:
+                    arduino.replies[station].acquire(timeout=30)
+
+        t0 = time.monotonic()
+        drivers = [threading.Thread(target=drive, args=(s,)) for s in stations]
+        for t in drivers:
+            t.start()
+        for t in drivers:
+            t.join()
+        # 남은 응답 대기
+        end = time.monotonic() + 30
+        while time.monotonic() < end and any(arduino.pending[s] for s in stations):
+            time.sleep(0.05)
+        elapsed = time.monotonic() - t0
+        if args.pipelined:
+            time.sleep(args.travel + 0.5)   # 마지막 부품의 분류 명령 대기
+
+    print(f"[*] stations={stations} count={args.count} rate={args.rate or 'closed-loop'} "
+          f"server={args.latency * 1000:.0f}ms±{args.jitter} chatter={args.chatter or 'off'}")
+    total = 0
+    for station in stations:
+        lat = arduino.latencies[station]
+        total += len(lat)
+        print(f"[{station}] replies={len(lat)}/{args.count} "
+              f"p50={percentile(lat, 50) * 1000:.1f}ms p95={percentile(lat, 95) * 1000:.1f}ms "
+              f"p99={percentile(lat, 99) * 1000:.1f}ms max={max(lat, default=float('nan')) * 1000:.1f}ms")
+    print(f"[*] sustained: {total / elapsed * 60:.1f} parts/min over {elapsed:.1f}s, unmatched={arduino.unmatched}")
+    if args.pipelined:
+        parts = {k: v for k, v in cam.metrics.summary()["counters"].items() if k.startswith("pipeline_parts_total")}
+        print(f"[*] sort commands: {dict(arduino.sorted)} parts: {parts}")
+    print(f"[*] uploaded to fake GCS: {len(gcs.names())}")
+
+    # 트리거 결과별 집계: 품질 검사 불합격/지연 초과/오류로 GO 를 보낸 건은 판정 경로가 아님
+    outcomes = collections.Counter()
+    for (name, labels), value in list(cam.metrics.counters.items()):
+        if name == "triggers_total":
+            outcomes[dict(labels)["outcome"]] += value
+    fallback = sum(outcomes[k] for k in ("fallback", "rejected", "error"))
+    print(f"[*] outcomes: {dict(outcomes)}")
+    if fallback > args.max_fallback * max(sum(outcomes.values()), 1):
+        print(f"[!] {fallback} replies were fallbacks (limit {args.max_fallback:.0%}), latencies above do not measure the verdict path")
+        os._exit(1)
+    os._exit(0)
+
+if __name__ == "__main__":
+    main()
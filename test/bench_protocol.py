@@ -0,0 +1,86 @@
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# 시리얼 프로토콜 파서 벤치마크: 텍스트/프레임 코덱의 초당 메시지 수 (수신 조각 크기별)
+# 손상/중복/유실 주입 시 재동기화와 집계가 맞는지도 함께 확인
+COUNT = 100000
+CHUNKS = (1, 16, 256, 4096)
+WORDS = (b"SNAP1\n", b"SNAP2\n", b"GO\n", b"X\n", b"RESULT:A\n")
+CHATTER = "감지X: 서보 90도, 모터 정지\n".encode()     # test/adu.ino 가 100ms 마다 출력하는 상태 줄
+COMMANDS = ("SNAP1", "SNAP2")
+
+def stream(codec, count):
+    return b"".join(codec.encode(WORDS[i % len(WORDS)], seq=i) for i in range(count))
+
+def bench(make, data, chunk):
+    codec = make()
+    t0 = time.perf_counter()
+    received = 0
+    for i in range(0, len(data), chunk):
+        received += len(codec.feed(data[i:i + chunk]))
+    elapsed = time.perf_counter() - t0
+    return received, elapsed
+
+def check_framed():
+    codec = cam.FramedCodec()
+    frames = [codec.encode(WORDS[i % len(WORDS)], seq=i) for i in range(100)]
+    assert cam.FramedCodec().feed(frames[0])[0].text == "SNAP1"
+
+    # 10번 프레임 CRC 손상, 20번 중복, 30~32번 유실, 사이사이 잡음
+    damaged = bytearray(frames[10])
+    damaged[-3] ^= 0xFF
+    frames[10] = bytes(damaged)
+    frames.insert(21, frames[20])
+    del frames[31:34]
+    noisy = b"".join(f + (b"\x00\xa5junk" if i % 7 == 0 else b"") for i, f in enumerate(frames))
+
+    rx = cam.FramedCodec()
+    rng = random.Random(1)
+    messages = []
+    pos = 0
+    while pos < len(noisy):
+        step = rng.randint(1, 40)
+        messages += rx.feed(noisy[pos:pos + step])
+        pos += step
+    messages += rx.feed(b"", arrived=time.monotonic() + 1)   # 끝에 남은 잘못된 SOF 정리
+    seqs = [m.seq for m in messages]
+    print("[*] Framed check:", dict(rx.stats))
+    assert 10 not in seqs and seqs.count(20) == 1, seqs
+    assert rx.stats["crc_errors"] >= 1 and rx.stats["duplicates"] == 1, rx.stats
+    assert rx.stats["lost"] == 1 + 3, rx.stats    # 손상 1 + 유실 3
+    assert len(messages) == 100 - 1 - 3, len(messages)
+
+# 상태 줄 9개당 트리거 1개인 텍스트 스트림: 트리거만 메시지로 나와야 함
+def bench_chatter(chunk):
+    data = b"".join((b"SNAP1\n" if i % 10 == 0 else CHATTER) for i in range(COUNT))
+    codec = cam.TextCodec(COMMANDS)
+    t0 = time.perf_counter()
+    received = 0
+    for i in range(0, len(data), chunk):
+        received += len(codec.feed(data[i:i + chunk]))
+    elapsed = time.perf_counter() - t0
+    assert received == COUNT // 10, received
+    assert codec.stats["chatter"] == COUNT - COUNT // 10, codec.stats
+    return elapsed
+
+def main():
+    check_framed()
+    for name, make in (("text", cam.TextCodec), ("framed", cam.FramedCodec)):
+        data = stream(make(), COUNT)
+        for chunk in CHUNKS:
+            received, elapsed = bench(make, data, chunk)
+            assert received == COUNT, (name, chunk, received)
+            print(f"{name:<7} chunk={chunk:<5} {COUNT / elapsed:>10,.0f} msg/s  {len(data) / COUNT:.1f} B/msg")
+    for chunk in CHUNKS[1:]:
+        elapsed = bench_chatter(chunk)
+        print(f"chatter chunk={chunk:<5} {COUNT / elapsed:>10,.0f} lines/s  (1 trigger per 10 lines)")
+    print("[+] Protocol benchmark done")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# 서킷 브레이커 확인: 예산 안에 응답하지 않는 (멈춘) 서버도 차단되고,
+# 응답 없는 시험 요청 뒤에도 cooldown 이 지나면 다시 시험해서 복구되는지
+
+HANG = 1.0      # 멈춘 서버의 응답 지연 (초)
+BUDGET = 0.2    # 트리거당 판정 예산 (초)
+COOLDOWN = 0.5  # 테스트용 차단 대기 시간 (초)
+
+state = {"hang": True, "calls": 0}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        state["calls"] += 1
+        if state["hang"]:
+            time.sleep(HANG)
+        body = json.dumps({"label": "O", "score": 0.9}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass   # 클라이언트가 예산 초과로 이미 끊음
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/defect"
+    breaker = cam.CircuitBreaker(failures=3, cooldown=COOLDOWN)
+    cam.breakers[url] = breaker
+
+    # 멈춘 서버: 예산 초과가 실패로 기록되어 차단기가 열려야 함
+    for i in range(3):
+        assert cam.post_image_to_server(b"x" * 100, url, budget=BUDGET, retries=1) is None
+        print(f"[*] Timeout {i + 1}: state={breaker.state} fail_count={breaker.fail_count}")
+    assert breaker.state == "open", breaker.state
+    calls = state["calls"]
+    assert cam.post_image_to_server(b"x" * 100, url, budget=BUDGET, retries=1) is None
+    assert state["calls"] == calls, "open breaker must skip the server"
+
+    # cooldown 후 시험 요청도 예산 초과: 다시 open (half_open 에 머물지 않음)
+    time.sleep(COOLDOWN)
+    assert cam.post_image_to_server(b"x" * 100, url, budget=BUDGET, retries=1) is None
+    print(f"[*] Probe timed out: state={breaker.state}")
+    assert breaker.state == "open", breaker.state
+
+    # 결과를 기록하지 못한 시험 요청 (멈춘 probe): cooldown 이 지나면 새 시험 요청 허용
+    time.sleep(COOLDOWN)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    time.sleep(COOLDOWN)
+    assert breaker.allow(), "stuck half_open probe must not block the server forever"
+
+    # 서버 복구: 다음 시험 요청이 성공하면 닫힘
+    state["hang"] = False
+    time.sleep(COOLDOWN)
+    result = cam.post_image_to_server(b"x" * 100, url, budget=BUDGET, retries=1)
+    print(f"[*] Recovered: {result} state={breaker.state}")
+    assert result is not None and breaker.state == "closed", (result, breaker.state)
+
+    server.shutdown()
+    print("[+] Circuit breaker test passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# ─────────────────────────────
+# 로컬 가짜 GCS 서버 (업로드 API만 흉내)
+# STORAGE_EMULATOR_HOST=http://127.0.0.1:<port> 로 google-cloud-storage 클라이언트를 붙여 사용
+class FakeGCS:
+    def __init__(self, port=0):
+        self.objects = {}          # "bucket/name" → bytes
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                # /upload/storage/v1/b/<bucket>/o
+                if len(parts) < 6 or parts[0] != "upload" or parts[4] == "":
+                    self.send_error(404)
+                    return
+                bucket = parts[4]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                query = parse_qs(url.query)
+                if query.get("uploadType") == ["multipart"]:
+                    name, data = fake._parse_multipart(self.headers["Content-Type"], body)
+                else:
+                    name, data = query.get("name", [""])[0], body
+                with fake.lock:
+                    fake.objects[f"{bucket}/{name}"] = data
+                payload = json.dumps({
+                    "kind": "storage#object", "bucket": bucket, "name": name,
+                    "size": str(len(data)), "generation": "1",
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread = None
+
+    @staticmethod
+    def _parse_multipart(content_type, body):
+        boundary = content_type.split("boundary=")[1].strip('"').encode()
+        sections = [p for p in body.split(b"--" + boundary) if p.strip(b"-\r\n")]
+        meta_head, meta = sections[0].split(b"\r\n\r\n", 1)
+        data_head, data = sections[1].split(b"\r\n\r\n", 1)
+        name = json.loads(meta.strip())["name"]
+        return name, data[:-2] if data.endswith(b"\r\n") else data
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def names(self):
+        with self.lock:
+            return sorted(self.objects)
@@ -0,0 +1,76 @@
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# 타임스탬프 링버퍼 확인: 드라이버 타임스탬프를 쓰는 가짜 카메라로 트리거 시각에 가장 가까운 프레임 선택
+FPS = 50
+EXPOSURE_LAG = 0.015     # 촬영부터 read() 반환까지 지연 (드라이버 타임스탬프가 이만큼 앞서야 함)
+
+class StampedCapture:
+    def __init__(self):
+        self.interval = 1 / FPS
+        self.next_time = time.monotonic()
+        self.count = 0
+        self.stamp = 0.0
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return self.stamp * 1000 if prop == cv2.CAP_PROP_POS_MSEC else 0
+
+    def read(self):
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time += self.interval
+        self.count += 1
+        self.stamp = time.monotonic() - EXPOSURE_LAG
+        image = np.full((120, 160, 3), self.count % 256, dtype=np.uint8)
+        return True, image
+
+    def release(self):
+        pass
+
+def main():
+    cam.open_capture = lambda index: StampedCapture()
+    cam.SETTLE_MAX = 0
+    stream = cam.CameraStream(0, buffer_size=16).start()
+    time.sleep(0.5)
+    assert stream.health()["hw_timestamps"], stream.health()
+
+    # 과거 시각: 링버퍼 안에서 바로 선택 (새 노출 대기 없음)
+    target = time.monotonic() - 0.1
+    t0 = time.monotonic()
+    frames = stream.read_at(target)
+    waited = time.monotonic() - t0
+    skew = abs(frames[0].timestamp - target)
+    print(f"[*] Past target: waited {waited * 1000:.1f}ms, skew {skew * 1000:.1f}ms")
+    assert waited < 0.005 and skew <= 0.5 / FPS + 0.002, (waited, skew)
+
+    # 가까운 미래 시각: 그 이후 프레임이 들어올 때까지만 대기
+    target = time.monotonic() + 0.05
+    frames = stream.read_at(target, n=3)
+    stamps = [f.timestamp for f in frames]
+    print("[*] Future target burst:", [round((t - target) * 1000, 1) for t in stamps])
+    assert stamps == sorted(stamps) and len(frames) == 3
+    assert min(abs(t - target) for t in stamps) <= 0.5 / FPS + 0.002
+
+    # 링버퍼보다 오래된 시각은 선택하지 않음 (가장 오래된 프레임과 한두 프레임 간격 이상 차이 나면 [])
+    assert stream.read_at(time.monotonic() - 5, timeout=1.0) == []
+    assert stream.read_at(time.monotonic() - 16 / FPS - 0.1, timeout=1.0) == []
+    stream.stop()
+    print("[+] Frame ring test passed")
+
+if __name__ == "__main__":
+    main()
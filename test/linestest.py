@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# 라인 설정 확인: 기본 한 라인은 기존 응답/헬스 키 유지, 추가 라인은 "라인/" 접두어로 분리
+
+def main():
+    lines = cam.default_lines()
+    snap1 = cam.station_config(cam.SNAP1_KEYWORD)
+    snap2 = cam.station_config(cam.SNAP2_KEYWORD)
+    assert snap1["camera"] == cam.CAM_IR1 and snap2["url"] == cam.URL_SNAP2
+
+    assert cam.reply_for(snap1, "X") == b"X\n"
+    assert cam.reply_for(snap1, "O") == b"GO\n"
+    assert cam.reply_for(snap1, None) == b"GO\n"
+    assert cam.reply_for(snap2, "A") == b"RESULT:A\n"
+    assert cam.reply_for(snap2, None) == b"GO\n"
+
+    cams, servers = cam.health_targets(lines)
+    assert set(cams) == {"camera1", "camera2"}, cams
+    assert set(servers) == {"defect_server", "classify_server"}, servers
+
+    other = {"name": "B", "port": "/dev/ttyACM1", "stations": {"SNAP1": dict(snap1, camera=4)}}
+    cams, servers = cam.health_targets(lines + [other])
+    assert cams["B/camera1"] == 4 and "B/defect_server" in servers, (cams, servers)
+
+    trace = cam.Trace(cam.SNAP1_KEYWORD, line="B", config=other["stations"]["SNAP1"])
+    assert trace.label == "B/SNAP1" and trace.config["camera"] == 4
+    assert cam.Trace(cam.SNAP2_KEYWORD).label == cam.SNAP2_KEYWORD
+    print("[+] Line config test passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+import cam_async
+
+# ─────────────────────────────
+# 로컬 모델 동작 확인: 평균 밝기로 O/X 를 가르는 작은 ONNX 모델을 만들어 판정
+# 밝을수록 X (불량), 어두울수록 O (정상)
+
+def build_model(path):
+    weights = helper.make_tensor("W", TensorProto.FLOAT, [3, 2], [-10.0, 10.0] * 3)
+    bias = helper.make_tensor("B", TensorProto.FLOAT, [2], [15.0, -15.0])
+    nodes = [
+        helper.make_node("GlobalAveragePool", ["input"], ["pooled"]),
+        helper.make_node("Flatten", ["pooled"], ["flat"]),
+        helper.make_node("Gemm", ["flat", "W", "B"], ["logits"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "brightness",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, 224, 224])],
+        [helper.make_tensor_value_info("logits", TensorProto.FLOAT, [1, 2])],
+        initializer=[weights, bias],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+# 응답하지 않는 / 오류를 내는 로컬 모델
+class StuckModel:
+    def __init__(self, error=None):
+        self.error = error
+
+    def submit(self, image):
+        future = Future()
+        if self.error:
+            future.set_exception(self.error)
+        return future
+
+# AsyncController.infer_defect (first_pass): 모델이 멈추거나 실패해도 서버에 물어봐야 함
+async def check_async(model, white, gray):
+    controller = cam_async.AsyncController(None)
+    calls = []
+    async def server(image_bytes, payload, trace):
+        calls.append(trace.id)
+        return {"label": "O", "source": "server"} if len(calls) > 1 else None
+    controller.infer_server = server
+    cam.LOCAL_MODEL_MODE = "first_pass"
+
+    cam.local_model = model
+    result = await controller.infer_defect(b"", white, cam.Trace(cam.SNAP1_KEYWORD))
+    print("[*] Async first pass, confident:", result)
+    assert result["label"] == "X" and not calls, (result, calls)
+    result = await controller.infer_defect(b"", gray, cam.Trace(cam.SNAP1_KEYWORD))
+    print("[*] Async first pass, unsure + server missed:", result)
+    assert result["source"] == "local" and len(calls) == 1, (result, calls)
+
+    cam.LOCAL_MODEL_TIMEOUT = 0.2
+    for stuck in (StuckModel(), StuckModel(RuntimeError("model crashed"))):
+        cam.local_model = stuck
+        t0 = time.monotonic()
+        result = await controller.infer_defect(b"", gray, cam.Trace(cam.SNAP1_KEYWORD))
+        print(f"[*] Async first pass, {'failing' if stuck.error else 'hung'} model:", result)
+        assert result == {"label": "O", "source": "server"}, result
+        assert time.monotonic() - t0 < 1.0
+    cam.local_model = model
+    await controller.client.close()
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(prefix="model_"), "brightness.onnx")
+    build_model(path)
+    model = cam.load_local_model(path)
+    assert model is not None
+
+    white = np.full((480, 640, 3), 255, dtype=np.uint8)
+    black = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    result = model.predict(white)
+    print("[*] White:", result)
+    assert result["label"] == "X" and result["source"] == "local", result
+    assert result["score"] > 0.99, result
+
+    result = model.submit(black).result(timeout=5)
+    print("[*] Black:", result)
+    assert result["label"] == "O", result
+
+    # infer_defect: 서버가 응답하지 않는 경우 (스텁)
+    calls = []
+    def server_miss(image_bytes, url, budget=10.0, retries=3, line=None):
+        calls.append(url)
+        return None
+    cam.post_image_to_server = server_miss
+    gray = np.full((480, 640, 3), 128, dtype=np.uint8)
+
+    cam.LOCAL_MODEL_MODE = "fallback"
+    trace = cam.Trace(cam.SNAP1_KEYWORD)
+    result = cam.infer_defect(b"", white, trace)
+    print("[*] Fallback, server missed:", result)
+    assert result["label"] == "X" and trace.notes.get("verdict") == "local", (result, trace.notes)
+    assert len(calls) == 1, calls
+
+    cam.LOCAL_MODEL_MODE = "first_pass"
+    trace = cam.Trace(cam.SNAP1_KEYWORD)
+    result = cam.infer_defect(b"", white, trace)
+    print("[*] First pass, confident:", result)
+    assert result["label"] == "X" and len(calls) == 1, (result, calls)
+
+    trace = cam.Trace(cam.SNAP1_KEYWORD)
+    result = cam.infer_defect(b"", gray, trace)
+    print("[*] First pass, unsure + server missed:", result)
+    assert result["source"] == "local" and result["score"] < cam.LOCAL_MODEL_CONFIDENT, result
+    assert len(calls) == 2, calls
+
+    asyncio.run(check_async(model, white, gray))
+
+    latency = cam.metrics.summary()
+    print("[*] Metrics:", latency)
+    assert "local_inference_seconds" in str(latency), latency
+    print("[+] Local model test passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# open_capture 확인: 카메라가 MJPG 를 실제로 받아들였을 때만 RGB 변환을 끔 (MJPG 원본 그대로 사용)
+# YUYV 로 남은 카메라는 디코딩된 BGR 프레임을 그대로 받아야 함
+
+class FormatCapture:
+    def __init__(self, accepts):
+        self.accepts = accepts
+        self.fourcc = cv2.VideoWriter_fourcc(*'YUYV')
+        self.props = {}
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        self.props[prop] = value
+        if prop == cv2.CAP_PROP_FOURCC and value in self.accepts:
+            self.fourcc = value
+        return True
+
+    def get(self, prop):
+        return float(self.fourcc) if prop == cv2.CAP_PROP_FOURCC else 0.0
+
+    def release(self):
+        pass
+
+def main():
+    cam.CAM_MJPEG_PASSTHROUGH = True
+    mjpg = cv2.VideoWriter_fourcc(*'MJPG')
+    for accepts, passthrough in (([mjpg], True), ([], False)):
+        cap = FormatCapture(accepts)
+        cam.cv2.VideoCapture = lambda index, backend: cap
+        assert cam.open_capture(0) is cap
+        converted = cap.props.get(cv2.CAP_PROP_CONVERT_RGB) != 0
+        print(f"[*] MJPG {'accepted' if accepts else 'rejected'}: convert_rgb={'on' if converted else 'off'}")
+        assert converted != passthrough, cap.props
+    print("[+] Open capture test passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+import cam_async
+
+# ─────────────────────────────
+# 시리얼 재연결 확인: 가상 포트(pty)를 심볼릭 링크로 연결해 두고 링크를 지웠다 다시 만들어 USB 재연결 흉내
+# 끊긴 동안 보낸 응답은 재연결 후 아두이노 쪽에 다시 도착해야 함
+
+def plug(link):
+    master, slave = os.openpty()
+    if os.path.lexists(link):
+        os.unlink(link)
+    os.symlink(os.ttyname(slave), link)
+    return master, slave
+
+def read_until(fd, expected, timeout=5):
+    buf = b""
+    end = time.monotonic() + timeout
+    os.set_blocking(fd, False)
+    while time.monotonic() < end and expected not in buf:
+        try:
+            buf += os.read(fd, 1024)
+        except BlockingIOError:
+            time.sleep(0.01)
+    return buf
+
+def main():
+    link = os.path.join(tempfile.mkdtemp(prefix="tty_"), "ttyFAKE")
+    master, slave = plug(link)
+    ser = cam.SupervisedSerial(cam.open_serial(link), cam.make_codec("text", ["SNAP1"]), port=link)
+    received = []
+
+    def read_loop():
+        while True:
+            received.extend(ser.read_messages())
+
+    threading.Thread(target=read_loop, daemon=True).start()
+
+    os.write(master, "감지X: 서보 90도, 모터 정지\nSNAP1\n".encode())
+    time.sleep(0.5)
+    assert [m.text for m in received] == ["SNAP1"], received
+
+    # 케이블 분리: 포트가 사라진 동안 보낸 응답은 대기열에 쌓임
+    os.close(master)
+    os.close(slave)
+    os.unlink(link)
+    time.sleep(0.3)
+    assert not ser.connected
+    ser.write(b"X\n")
+    assert len(ser.replies) == 1
+
+    # 다시 연결: 아두이노가 출력을 시작하면 밀린 응답 재전송
+    t0 = time.monotonic()
+    master, slave = plug(link)
+    while not ser.connected and time.monotonic() - t0 < 2:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - t0
+    print(f"[*] Reconnected in {elapsed * 1000:.0f}ms")
+    assert ser.connected and elapsed < 0.5, elapsed
+    # 상태 출력(코덱이 버리는 줄)만 와도 부팅 대기(SERIAL_BOOT_WAIT)를 기다리지 않고 바로 재전송
+    t0 = time.monotonic()
+    os.write(master, "감지X: 서보 90도, 모터 정지\n".encode())
+    replayed = read_until(master, b"X\n")
+    waited = time.monotonic() - t0
+    print(f"[*] Replayed {waited * 1000:.0f}ms after chatter")
+    assert replayed.endswith(b"X\n"), replayed
+    assert waited < cam.SERIAL_BOOT_WAIT / 2, waited
+    assert len(ser.replies) == 0
+    print("[*] Stats:", ser.stats())
+    check_reply_log()
+    asyncio.run(check_async_stop())
+    print("[+] Serial reconnect test passed")
+
+# framed 응답의 ACK 대기: ACK 를 보내지 않는 펌웨어에는 이미 보낸 응답을 재전송하지 않음
+def check_reply_log():
+    log = cam.ReplyLog()
+    log.sent(b"SERVO 30\n", 1)
+    assert log.take_replay() == [], "replayed replies to firmware that never sends ACKs"
+    log.ack(1)
+    log.sent(b"SERVO 30\n", 2)
+    log.sent(b"GO\n", 3)
+    log.ack(2)
+    assert log.take_replay() == [(b"GO\n", 3)]
+
+# AsyncSerial.stop: 진행 중인 재연결 작업을 취소하고 끝날 때까지 기다림
+async def check_async_stop():
+    link = os.path.join(tempfile.mkdtemp(prefix="tty_"), "ttyFAKE")
+    master, slave = plug(link)
+    loop = asyncio.get_running_loop()
+    reader = cam_async.AsyncSerial(cam.open_serial(link), cam.make_codec("text", ["SNAP1"]), port=link).start(loop)
+    os.close(master)
+    os.close(slave)
+    os.unlink(link)
+    reader._mark_lost()
+    task = reader.reconnect_task
+    await asyncio.sleep(0.2)
+    assert task is not None and not task.done()
+    await reader.stop()
+    assert task.cancelled() and reader.reconnect_task is None
+    # 포트 대기 스레드는 포트가 다시 생기면 끝남 (취소된 작업은 포트를 다시 열지 않음)
+    master, slave = plug(link)
+    await asyncio.sleep(0.5)
+    assert not reader.connected and reader.reconnects == 0
+    os.close(master)
+    os.close(slave)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fake_gcs import FakeGCS
+
+# ─────────────────────────────
+# 업로드 보관소(spool) 동작 확인: 오프라인 보관 → 용량 초과 삭제 → 재시작 후 재전송
+IMAGE_SIZE = 1000
+IMAGE_COUNT = 10
+MAX_BYTES = 8 * IMAGE_SIZE
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(cond, timeout=20):
+    end = time.time() + timeout
+    while time.time() < end:
+        if cond():
+            return True
+        time.sleep(0.1)
+    return False
+
+def main():
+    port = free_port()
+    os.environ["STORAGE_EMULATOR_HOST"] = f"http://127.0.0.1:{port}"
+    import cam
+
+    spool_dir = tempfile.mkdtemp(prefix="spool_")
+
+    # 1) 서버가 꺼진 상태: 업로드 실패 → 디스크에 보관, 용량 초과분은 오래된 것부터 삭제
+    spool = cam.UploadSpool(spool_dir, max_bytes=MAX_BYTES, workers=4).start()
+    for i in range(IMAGE_COUNT):
+        spool.put(bytes([i]) * IMAGE_SIZE, f"part_{i:02d}.jpg", "raw_test")
+    stats = spool.stats()
+    print("[*] Offline:", stats)
+    assert stats["pending"] == 8, stats
+    assert stats["evicted"] == 2, stats
+    assert stats["bytes"] <= MAX_BYTES, stats
+    # 업로드가 라이브러리 재시도에 묶이지 않고 바로 실패해야 spool 의 재시도 대기가 동작함
+    assert wait_for(lambda: spool.stats()["retries"] >= 1, timeout=cam.GCS_UPLOAD_TIMEOUT + 5), spool.stats()
+    spool.close()
+
+    # 2) 재시작 + 서버 복구: 남은 항목이 병렬로 모두 업로드되어야 함
+    gcs = FakeGCS(port).start()
+    try:
+        spool = cam.UploadSpool(spool_dir, max_bytes=MAX_BYTES, workers=4).start()
+        assert wait_for(lambda: spool.stats()["pending"] == 0), spool.stats()
+        expected = [f"{cam.BUCKET_NAME}/raw_test/part_{i:02d}.jpg" for i in range(2, IMAGE_COUNT)]
+        assert gcs.names() == expected, gcs.names()
+        assert gcs.objects[expected[0]] == bytes([2]) * IMAGE_SIZE
+        leftovers = [n for n in os.listdir(spool_dir) if not n.startswith("index.db")]
+        assert leftovers == [], leftovers
+        print("[*] Drained:", spool.stats())
+        spool.close()
+    finally:
+        gcs.stop()
+    print("[+] Spool test passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cam
+
+# ─────────────────────────────
+# 판정 캐시 확인: 같은 부품의 재트리거(짧은 간격, 벨트 재개 없음, 또는 같은 순번)만 재사용
+# 다음 부품은 작은 결함만 다르면 해시가 거의 같으므로 반드시 재검사해야 함
+
+def part_image(seed):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (8, 12, 3), dtype=np.uint8)
+    return cv2.resize(small, (640, 480), interpolation=cv2.INTER_CUBIC)
+
+# 같은 제품의 다음 부품: 긁힘과 얼룩 하나만 다름
+def defective(image):
+    out = image.copy()
+    cv2.line(out, (200, 150), (320, 190), (0, 0, 0), 3)
+    cv2.circle(out, (420, 300), 12, (20, 20, 20), -1)
+    return out
+
+def main():
+    cache = cam.VerdictCache(size=4, window=0.3, ttl=1.0, distance=4)
+    part = part_image(1)
+    noisy = np.clip(part.astype(np.int16) + np.random.default_rng(9).integers(-3, 4, part.shape), 0, 255).astype(np.uint8)
+    scratched = defective(part)
+    other = part_image(2)
+
+    key = cam.perceptual_hash(part)
+    t0 = time.monotonic()
+    assert cache.get("snap1", key, t0) is None
+    cache.put("snap1", key, {"label": "O"}, t0)
+
+    # 재트리거 (짧은 간격, 벨트 재개 없음): 노이즈만 다르면 재사용
+    hit = cache.get("snap1", cam.perceptual_hash(noisy), t0 + 0.1)
+    print("[*] Re-trigger:", hit)
+    assert hit and hit["label"] == "O", hit
+    assert cache.get("snap1", cam.perceptual_hash(other), t0 + 0.1) is None
+    assert cache.get("snap2", key, t0 + 0.1) is None
+
+    # 다음 부품: 해시 거리는 가깝지만 트리거 간격이 길면 재검사
+    distance = bin(cam.perceptual_hash(scratched) ^ key).count("1")
+    print("[*] Scratched part distance:", distance)
+    assert cache.get("snap1", cam.perceptual_hash(scratched), t0 + 1.0) is None, "next part reused a verdict"
+
+    # 짧은 간격이라도 그 사이 벨트가 재개되면 다른 부품
+    t1 = time.monotonic()
+    cache.put("snap1", key, {"label": "O"}, t1)
+    assert cache.get("snap1", key, t1 + 0.1) is not None
+    cache.release("snap1")
+    assert cache.get("snap1", key, time.monotonic()) is None, "verdict reused across a belt release"
+
+    # 같은 순번 재전송은 간격과 상관없이 재사용, 유효 시간이 지나면 만료
+    t2 = time.monotonic()
+    cache.put("snap1", key, {"label": "X"}, t2, seq=7)
+    assert cache.get("snap1", key, t2 + 0.8, seq=7)["label"] == "X"
+    assert cache.get("snap1", key, t2 + 0.8, seq=8) is None
+    time.sleep(1.1)
+    assert cache.get("snap1", key, time.monotonic(), seq=7) is None, "expired entry reused"
+
+    for i in range(6):
+        cache.put("snap1", 1 << (i * 10), {"label": "O"}, time.monotonic())
+    assert cache.stats()["snap1"] == 4, cache.stats()
+    check_run_station(part, scratched)
+    print("[*] Metrics:", cam.metrics.summary())
+    print("[+] Verdict cache test passed")
+
+class FakeSerial:
+    def __init__(self):
+        self.sent = []
+
+    def write(self, data):
+        self.sent.append(data)
+        return len(data)
+
+# 정지-재개 모드의 run_station: 응답(벨트 재개) 후 바로 들어온 다음 부품은 해시가 가까워도 재검사,
+# 같은 순번 재전송만 재사용하고 캐시 적중은 다시 업로드하지 않음
+def check_run_station(part, scratched):
+    cam.PIPELINE_MODE = False
+    cam.verdict_cache = cam.VerdictCache(size=4, window=0.3, ttl=1.0, distance=4)
+    frames = [part, scratched, scratched]
+    archived, inferred = [], []
+    cam.capture_for_station = lambda index, trace, burst=1: cam.Frame(image=frames.pop(0))
+    cam.archive_frame = lambda frame, filename, folder, line=None: archived.append(filename)
+    def infer(image_bytes, payload, trace):
+        inferred.append(trace.seq)
+        return {"label": "O" if len(inferred) == 1 else "X"}
+
+    ser = FakeSerial()
+    cam.run_station(ser, cam.Trace(cam.SNAP1_KEYWORD, seq=1), infer)
+    cam.run_station(ser, cam.Trace(cam.SNAP1_KEYWORD, seq=2), infer)
+    print("[*] run_station replies:", ser.sent)
+    assert inferred == [1, 2], "next part reused the previous part's verdict"
+    assert ser.sent[1] == cam.reply_for(cam.station_config(cam.SNAP1_KEYWORD), "X"), ser.sent
+
+    cam.run_station(ser, cam.Trace(cam.SNAP1_KEYWORD, seq=2), infer)
+    assert inferred == [1, 2] and ser.sent[2] == ser.sent[1], (inferred, ser.sent)
+    assert len(archived) == 2, archived
+
+if __name__ == "__main__":
+    main()